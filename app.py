@@ -1,7 +1,12 @@
 from flask import Flask
+from flask.cli import AppGroup
 from flask_login import LoginManager
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import threading
 from datetime import datetime
 
 from config import Config
@@ -9,6 +14,12 @@ from managers.database_manager import DatabaseManager
 from managers.auth_manager import AuthManager
 from services.routes import create_routes
 
+LOG_FLUSH_INTERVAL = 30  # seconds
+LOG_DIR = 'logs'
+LOG_FILENAME = os.path.join(LOG_DIR, f"app_{datetime.now().strftime('%Y%m%d')}.log")
+
+logger = logging.getLogger(__name__)
+
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
@@ -19,6 +30,20 @@ def create_app():
     # Initialize database
     db_manager = DatabaseManager()
     
+    # Schema changes only run through `flask db init`, never on a worker's boot. Serving checks
+    # the schema on its first request instead, so the CLI can load the app against an old schema
+    schema_current = threading.Event()
+    
+    @app.before_request
+    def require_current_schema():
+        if schema_current.is_set():
+            return None
+        if not db_manager.schema_is_current():
+            logger.error("Database schema is out of date; run `flask db init`")
+            return "Database schema is out of date; run `flask db init` before using the app", 503
+        schema_current.set()
+        return None
+    
     # Setup Flask-Login
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -33,31 +58,68 @@ def create_app():
     def load_user(user_id):
         return auth_manager.get_user_by_id(int(user_id))
     
-    # Create upload directory
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    os.makedirs('logs', exist_ok=True)
-    
     # Register routes
     create_routes(app, db_manager, auth_manager)
     
+    # Database commands
+    db_cli = AppGroup('db', help='Database management commands.')
+    
+    @db_cli.command('init')
+    def init_db():
+        """Create missing tables and seed the default levels and tasks."""
+        db_manager.create_tables()
+        print("Database tables created/verified")
+    
+    app.cli.add_command(db_cli)
+    
     return app
 
 def setup_logging():
-    log_filename = f"logs/app_{datetime.now().strftime('%Y%m%d')}.log"
+    # Already configured (autoreload, tests); don't stack duplicate handlers
+    if logging.getLogger().handlers:
+        return
+    
+    os.makedirs(LOG_DIR, exist_ok=True)
+    formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    
+    file_handler = logging.FileHandler(LOG_FILENAME)
+    file_handler.setFormatter(formatter)
+    # Buffer file writes; errors still reach disk immediately
+    buffered_file_handler = logging.handlers.MemoryHandler(
+        capacity=1024, flushLevel=logging.ERROR, target=file_handler, flushOnClose=True
+    )
+    atexit.register(buffered_file_handler.close)
+    start_periodic_flush(buffered_file_handler, LOG_FLUSH_INTERVAL)
+    stream_handler = logging.StreamHandler()  # Only for app startup info
+    stream_handler.setFormatter(formatter)
+    
+    # Request threads only enqueue records; a background listener does the I/O
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(
+        log_queue, buffered_file_handler, stream_handler, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
     
     logging.basicConfig(
         level=logging.INFO,
-        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-        handlers=[
-            logging.FileHandler(log_filename),
-            logging.StreamHandler()  # Only for app startup info
-        ]
+        handlers=[logging.handlers.QueueHandler(log_queue)]
     )
     
     # Reduce noise from external libraries
     logging.getLogger('requests').setLevel(logging.WARNING)
     logging.getLogger('urllib3').setLevel(logging.WARNING)
 
+def start_periodic_flush(handler, interval):
+    """Flush a buffering log handler every `interval` seconds from a daemon thread"""
+    def flush_loop():
+        while not stop_event.wait(interval):
+            handler.flush()
+    
+    stop_event = threading.Event()
+    threading.Thread(target=flush_loop, name='log-flush', daemon=True).start()
+    atexit.register(stop_event.set)
+
 if __name__ == '__main__':
     app = create_app()
     print("🎤 Gamified Public Speaking App Starting...")
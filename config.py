@@ -9,9 +9,16 @@ class Config:
     MYSQL_USER = os.environ.get('MYSQL_USER', 'root')
     MYSQL_PASSWORD = os.environ.get('MYSQL_PASSWORD', '')
     MYSQL_DB = os.environ.get('MYSQL_DB', 'gamified_speaking')
+    DB_POOL_MIN_CACHED = int(os.environ.get('DB_POOL_MIN_CACHED', 2))
+    DB_POOL_MAX_CACHED = int(os.environ.get('DB_POOL_MAX_CACHED', 10))
+    DB_POOL_MAX_CONNECTIONS = int(os.environ.get('DB_POOL_MAX_CONNECTIONS', 20))
     ASSEMBLY_AI_KEY = os.environ.get('assembly_key')
     GEMINI_API_KEY = os.environ.get('gemini_api_key')   
     CLOUDCONVERT_API_KEY = os.environ.get('cloud_convert_key')
-    UPLOAD_FOLDER = 'static/audio'
+    # Public URL AssemblyAI can reach; enables the transcript-completed webhook
+    PUBLIC_BASE_URL = os.environ.get('public_base_url')
+    ASSEMBLY_AI_WEBHOOK_TOKEN = os.environ.get('assembly_webhook_token')
+    # Live captions open a billed AssemblyAI realtime session per recording; scoring never uses them
+    LIVE_CAPTIONS_ENABLED = os.environ.get('live_captions', 'false').lower() == 'true'
     MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB max file size
     LOG_LEVEL = 'INFO'
\ No newline at end of file
@@ -1,69 +1,55 @@
-import google.generativeai as genai
-import json
+import functools
+import orjson
+import re
+import simdjson
 import logging
+import threading
+from collections import Counter
 from config import Config
 
 logger = logging.getLogger(__name__)
 
-class AIManager:
-    def __init__(self):
-        self.config = Config()
-        genai.configure(api_key=self.config.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
+# Fields of the Gemini response read by the routes and statistics updater.
+# filler_count, weak_words_count and repetition_score are counted locally.
+ANALYSIS_SCALAR_KEYS = ('flow_score', 'confidence_score', 'detailed_feedback')
+ANALYSIS_LIST_KEYS = ('strengths', 'improvement_areas')
 
-    def analyze_speech(self, transcription, task_prompt=None):
-        try:
-            analysis_prompt = f"""
+WORD_PATTERN = re.compile(r"[a-z']+")
+# "like" is left out on purpose: the analogy tasks are answered with "X is like..."
+FILLER_WORDS = frozenset({'um', 'umm', 'uh', 'uhm', 'er', 'erm', 'ah', 'hmm'})
+FILLER_PHRASES = frozenset({('you', 'know'), ('i', 'mean')})
+WEAK_WORDS = frozenset({'maybe', 'probably', 'perhaps', 'possibly', 'somewhat'})
+WEAK_PHRASES = frozenset({('sort', 'of'), ('kind', 'of'), ('i', 'guess'), ('i', 'think')})
+
+# Prompt text is fixed apart from the transcription and task context
+ANALYSIS_PROMPT_HEAD = '''
             You are analyzing a transcribed speech for a gamified public speaking application. 
             
             TRANSCRIBED SPEECH (raw with filler words and pauses):
-            "{transcription}"
+            "'''
+ANALYSIS_PROMPT_MID = '''"
             
-            TASK CONTEXT: {task_prompt if task_prompt else "General speech analysis"}
+            TASK CONTEXT: '''
+ANALYSIS_PROMPT_TAIL = """
             
             Provide a detailed analysis in STRICT JSON format with these exact keys:
-            {{
-                "repetition_score": [0-100 score, where 100 is no repetition],
-                "filler_count": [total count of um, uh, like, you know, etc.],
-                "weak_words_count": [count of uncertain words like maybe, probably, sort of],
+            {
                 "flow_score": [0-100 score for overall speech flow and coherence],
                 "confidence_score": [0-100 score based on word choice and delivery],
-                "summary": {{
+                "summary": {
                     "flow": "Brief assessment of speech flow and structure",
                     "weakness": "Main areas needing improvement",
                     "growth_potential": "Specific suggestions for improvement"
-                }},
+                },
                 "detailed_feedback": "Comprehensive feedback paragraph",
                 "strengths": ["list", "of", "identified", "strengths"],
                 "improvement_areas": ["specific", "areas", "to", "work", "on"]
-            }}
+            }
             
             Analyze the speech thoroughly and provide constructive, encouraging feedback.
             """
-            
-            response = self.model.generate_content(analysis_prompt)
-            
-            # Clean and parse the response
-            response_text = response.text.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text[7:-3]
-            elif response_text.startswith('```'):
-                response_text = response_text[3:-3]
-            
-            analysis = json.loads(response_text)
-            logger.info("Speech analysis completed successfully")
-            return analysis
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parsing error: {e}")
-            return self._fallback_analysis()
-        except Exception as e:
-            logger.error(f"AI analysis error: {e}")
-            return self._fallback_analysis()
 
-    def generate_quick_task(self):
-        try:
-            prompt = """
+QUICK_TASK_PROMPT = """
             Generate a creative sentence starter for a public speaking quick task. 
             This should be engaging and thought-provoking, suitable for impromptu speaking practice.
             
@@ -76,16 +62,88 @@ class AIManager:
             
             Make it creative and varied - could be about life, business, relationships, nature, technology, dreams, etc.
             """
+
+def count_speech_metrics(transcription):
+    """Count filler words, weak words and repetitions directly from the transcription"""
+    words = WORD_PATTERN.findall(transcription.lower())
+    word_counts = Counter(words)
+    bigram_counts = Counter(zip(words, words[1:]))
+    
+    filler_count = (sum(word_counts[word] for word in FILLER_WORDS) +
+                    sum(bigram_counts[phrase] for phrase in FILLER_PHRASES))
+    weak_words_count = (sum(word_counts[word] for word in WEAK_WORDS) +
+                        sum(bigram_counts[phrase] for phrase in WEAK_PHRASES))
+    
+    # Repetitions: stuttered words ("the the") plus every reuse of a three-word phrase
+    content = [word for word in words if word not in FILLER_WORDS]
+    repeats = sum(1 for first, second in zip(content, content[1:]) if first == second)
+    trigram_counts = Counter(zip(content, content[1:], content[2:]))
+    repeats += sum(count - 1 for count in trigram_counts.values() if count > 1)
+    
+    # Each repetition per 100 words costs 2 points
+    repetition_score = max(0, round(100 - 200 * repeats / len(content))) if content else 100
+    
+    return {
+        "filler_count": filler_count,
+        "weak_words_count": weak_words_count,
+        "repetition_score": repetition_score
+    }
+
+@functools.lru_cache(maxsize=1)
+def get_ai_manager():
+    """Return the process-wide AIManager so Gemini is configured only once"""
+    return AIManager()
+
+class AIManager:
+    def __init__(self):
+        self.config = Config()
+        self._local = threading.local()
+
+    @functools.cached_property
+    def model(self):
+        """Gemini model, configured on first use so non-AI requests never load the SDK"""
+        import google.generativeai as genai
+
+        genai.configure(api_key=self.config.GEMINI_API_KEY)
+        return genai.GenerativeModel('gemini-2.5-pro')
+
+    @property
+    def _sjparser(self):
+        """Per-thread simdjson parser so its internal buffers are reused across calls"""
+        parser = getattr(self._local, 'parser', None)
+        if parser is None:
+            parser = self._local.parser = simdjson.Parser()
+        return parser
+
+    def analyze_speech(self, transcription, task_prompt=None):
+        metrics = count_speech_metrics(transcription)
+        
+        try:
+            analysis_prompt = ''.join((
+                ANALYSIS_PROMPT_HEAD, transcription,
+                ANALYSIS_PROMPT_MID, task_prompt if task_prompt else "General speech analysis",
+                ANALYSIS_PROMPT_TAIL
+            ))
             
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            if response_text.startswith('```json'):
-                response_text = response_text[7:-3]
-            elif response_text.startswith('```'):
-                response_text = response_text[3:-3]
+            # Stream the response and parse as soon as the JSON object is complete
+            response = self.model.generate_content(analysis_prompt, stream=True)
+            doc = self._sjparser.parse(self._read_json_object(response))
+            # Fields the model left out keep their fallback values, so every score is always present
+            analysis = {**self._fallback_analysis(), **self._extract_analysis(doc), **metrics}
+            logger.info("Speech analysis completed successfully")
+            return analysis
             
-            task = json.loads(response_text)
+        except ValueError as e:
+            logger.error(f"JSON parsing error: {e}")
+            return {**self._fallback_analysis(), **metrics}
+        except Exception as e:
+            logger.error(f"AI analysis error: {e}")
+            return {**self._fallback_analysis(), **metrics}
+
+    def generate_quick_task(self):
+        try:
+            response = self.model.generate_content(QUICK_TASK_PROMPT)
+            task = orjson.loads(self._response_bytes(response))
             logger.info("Quick task generated successfully")
             return task
             
@@ -93,6 +151,64 @@ class AIManager:
             logger.error(f"Quick task generation error: {e}")
             return self._fallback_quick_task()
 
+    def _extract_analysis(self, doc):
+        """Materialize only the expected analysis fields from a parsed simdjson document.
+        
+        Values of the wrong shape are dropped so their fallbacks apply; a nested value left in
+        place would be a live proxy into the parser's document, which json.dumps can't encode.
+        """
+        analysis = {}
+        for key in ANALYSIS_SCALAR_KEYS:
+            if key in doc and isinstance(doc[key], (str, int, float)):
+                analysis[key] = doc[key]
+        for key in ANALYSIS_LIST_KEYS:
+            if key in doc and isinstance(doc[key], simdjson.Array):
+                analysis[key] = doc[key].as_list()
+        if 'summary' in doc and isinstance(doc['summary'], simdjson.Object):
+            analysis['summary'] = doc['summary'].as_dict()
+        return analysis
+
+    def _read_json_object(self, response_stream):
+        """Accumulate streamed chunks until the first top-level JSON object is closed"""
+        buffer = bytearray()
+        depth = 0
+        start = None
+        in_string = False
+        escaped = False
+        
+        for chunk in response_stream:
+            offset = len(buffer)
+            buffer += chunk.text.encode()
+            
+            for index in range(offset, len(buffer)):
+                char = buffer[index]
+                if in_string:
+                    if escaped:
+                        escaped = False
+                    elif char == 0x5C:  # backslash
+                        escaped = True
+                    elif char == 0x22:  # quote
+                        in_string = False
+                elif char == 0x22:
+                    in_string = start is not None
+                elif char == 0x7B:  # {
+                    if start is None:
+                        start = index
+                    depth += 1
+                elif char == 0x7D and start is not None:  # }
+                    depth -= 1
+                    if depth == 0:
+                        return bytes(buffer[start:index + 1])
+        
+        # No complete object arrived; let the parser report the error
+        return bytes(buffer[start:]) if start is not None else bytes(buffer)
+
+    def _response_bytes(self, response):
+        """Strip markdown code fences and return the JSON payload as bytes"""
+        response_text = response.text.strip()
+        response_text = response_text.removeprefix('```json').removeprefix('```').removesuffix('```')
+        return response_text.strip().encode()
+
     def _fallback_analysis(self):
         return {
             "repetition_score": 75,
@@ -1,9 +1,58 @@
-from werkzeug.security import generate_password_hash, check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
 from flask_login import UserMixin
 import logging
+import os
+import threading
 
 logger = logging.getLogger(__name__)
 
+# Running averages are computed by MySQL in one atomic statement.
+# total_speeches is assigned last because MySQL evaluates SET left to right.
+# Folds one speech into the running averages, creating the row for a user's first speech
+# (uq_us_user makes concurrent first speeches meet on one row)
+UPSERT_STATISTICS_QUERY = '''
+    INSERT INTO user_statistics
+    (avg_filler_count, avg_repetition_score, avg_flow_score, user_id, total_speeches)
+    VALUES (%s, %s, %s, %s, 1)
+    ON DUPLICATE KEY UPDATE
+        avg_filler_count = (avg_filler_count * total_speeches + VALUES(avg_filler_count)) / (total_speeches + 1), 
+        avg_repetition_score = (avg_repetition_score * total_speeches + VALUES(avg_repetition_score)) / (total_speeches + 1), 
+        avg_flow_score = (avg_flow_score * total_speeches + VALUES(avg_flow_score)) / (total_speeches + 1),
+        total_speeches = total_speeches + 1,
+        last_activity = CURRENT_TIMESTAMP
+'''
+
+password_hasher = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=1)
+# Bounds concurrent KDF work to the core count during login/registration bursts
+password_hash_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='password-hash')
+
+def check_password(stored_hash, password):
+    """Return (matches, needs_rehash) for a stored argon2 or legacy werkzeug hash"""
+    if stored_hash.startswith('$argon2'):
+        try:
+            password_hasher.verify(stored_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False, False
+        return True, password_hasher.check_needs_rehash(stored_hash)
+    
+    # Accounts created before argon2 still carry werkzeug pbkdf2/scrypt hashes
+    from werkzeug.security import check_password_hash
+    
+    return check_password_hash(stored_hash, password), True
+
+def numeric_score(value):
+    """A model-reported score as a number; null or non-numeric values count as 0"""
+    return value if isinstance(value, (int, float)) else 0
+
+def statistics_params(user_id, speech_analysis):
+    """Parameters for UPSERT_STATISTICS_QUERY; missing or non-numeric scores count as 0"""
+    return (numeric_score(speech_analysis.get('filler_count')),
+            numeric_score(speech_analysis.get('repetition_score')),
+            numeric_score(speech_analysis.get('flow_score')), user_id)
+
 class User(UserMixin):
     def __init__(self, user_data):
         self.id = user_data['id']
@@ -23,20 +72,24 @@ class User(UserMixin):
 class AuthManager:
     def __init__(self, db_manager):
         self.db = db_manager
+        # user_loader runs on every authenticated request; keep recent user rows briefly
+        self._user_cache = TTLCache(maxsize=4096, ttl=60)
+        self._user_cache_lock = threading.Lock()
 
     def create_user(self, username, email, password):
         try:
             # Check if user already exists
             existing_user = self.db.execute_single_query(
-                "SELECT id FROM users WHERE username = %s OR email = %s",
-                (username, email)
+                "SELECT id FROM users WHERE username = %s OR email = %s LIMIT 1",
+                (username, email),
+                cursor_class=self.db.tuple_cursor
             )
             
             if existing_user:
                 return None, "Username or email already exists"
             
             # Create password hash
-            password_hash = generate_password_hash(password)
+            password_hash = password_hash_pool.submit(password_hasher.hash, password).result()
             
             # Insert new user
             user_id = self.db.insert_query(
@@ -67,7 +120,7 @@ class AuthManager:
             if not user_data:
                 return None, "Invalid username or password"
             
-            if not check_password_hash(user_data['password_hash'], password):
+            if not self._verify_password(user_data, password):
                 return None, "Invalid username or password"
             
             user = User(user_data)
@@ -78,12 +131,36 @@ class AuthManager:
             logger.error(f"Authentication error: {e}")
             return None, "Login failed"
 
+    def _verify_password(self, user_data, password):
+        """Check a password against its stored hash, upgrading legacy hashes to argon2"""
+        matches, needs_rehash = password_hash_pool.submit(
+            check_password, user_data['password_hash'], password
+        ).result()
+        
+        if not matches:
+            return False
+        
+        if needs_rehash:
+            self.db.execute_query(
+                "UPDATE users SET password_hash = %s WHERE id = %s",
+                (password_hash_pool.submit(password_hasher.hash, password).result(), user_data['id'])
+            )
+            self.invalidate_user(user_data['id'])
+        return True
+
     def get_user_by_id(self, user_id):
         try:
-            user_data = self.db.execute_single_query(
-                "SELECT * FROM users WHERE id = %s AND is_active = TRUE",
-                (user_id,)
-            )
+            with self._user_cache_lock:
+                user_data = self._user_cache.get(user_id)
+            
+            if user_data is None:
+                user_data = self.db.execute_single_query(
+                    "SELECT * FROM users WHERE id = %s AND is_active = TRUE",
+                    (user_id,)
+                )
+                if user_data:
+                    with self._user_cache_lock:
+                        self._user_cache[user_id] = user_data
             
             if user_data:
                 return User(user_data)
@@ -93,6 +170,11 @@ class AuthManager:
             logger.error(f"Get user error: {e}")
             return None
 
+    def invalidate_user(self, user_id):
+        """Drop a cached user row after the users table has been modified"""
+        with self._user_cache_lock:
+            self._user_cache.pop(user_id, None)
+
     def get_user_progress(self, user_id):
         try:
             progress = self.db.execute_query('''
@@ -119,9 +201,9 @@ class AuthManager:
             )
             
             if not stats:
-                # Create default statistics if none exist
+                # Create default statistics if none exist (a concurrent request may beat us to it)
                 self.db.insert_query(
-                    "INSERT INTO user_statistics (user_id) VALUES (%s)",
+                    "INSERT IGNORE INTO user_statistics (user_id) VALUES (%s)",
                     (user_id,)
                 )
                 stats = self.db.execute_single_query(
@@ -133,39 +215,4 @@ class AuthManager:
             
         except Exception as e:
             logger.error(f"Get user statistics error: {e}")
-            return None
-
-    def update_user_statistics(self, user_id, speech_analysis):
-        try:
-            current_stats = self.get_user_statistics(user_id)
-            if not current_stats:
-                return False
-            
-            # Calculate new averages
-            total_speeches = current_stats['total_speeches'] + 1
-            
-            new_avg_filler = ((current_stats['avg_filler_count'] * current_stats['total_speeches']) + 
-                             speech_analysis['filler_count']) / total_speeches
-            
-            new_avg_repetition = ((current_stats['avg_repetition_score'] * current_stats['total_speeches']) + 
-                                 speech_analysis['repetition_score']) / total_speeches
-            
-            new_avg_flow = ((current_stats['avg_flow_score'] * current_stats['total_speeches']) + 
-                           speech_analysis['flow_score']) / total_speeches
-            
-            # Update statistics
-            self.db.execute_query('''
-                UPDATE user_statistics 
-                SET total_speeches = %s, 
-                    avg_filler_count = %s, 
-                    avg_repetition_score = %s, 
-                    avg_flow_score = %s,
-                    last_activity = CURRENT_TIMESTAMP
-                WHERE user_id = %s
-            ''', (total_speeches, new_avg_filler, new_avg_repetition, new_avg_flow, user_id))
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Update user statistics error: {e}")
-            return False
\ No newline at end of file
+            return None
\ No newline at end of file
@@ -1,118 +1,237 @@
-import pymysql
 import logging
+from contextlib import contextmanager
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# ai_feedback score fields promoted to columns for cheap aggregates: (table, column, type)
+ADDED_COLUMNS = [
+    ('speech_responses', 'repetition_score', 'SMALLINT NULL'),
+    ('speech_responses', 'flow_score', 'SMALLINT NULL'),
+    ('speech_responses', 'confidence_score', 'SMALLINT NULL'),
+    ('speech_responses', 'filler_count', 'SMALLINT NULL'),
+    ('speech_responses', 'weak_words_count', 'SMALLINT NULL'),
+]
+
+# Keeps the best row per (user_id, level_id): completed first, then highest score, then newest
+DEDUPE_USER_PROGRESS_QUERY = '''
+    DELETE p FROM user_progress p
+    JOIN user_progress keep
+      ON keep.user_id = p.user_id AND keep.level_id = p.level_id
+     AND (COALESCE(keep.is_completed, 0), COALESCE(keep.score, 0), keep.id)
+       > (COALESCE(p.is_completed, 0), COALESCE(p.score, 0), p.id)
+'''
+
+# Keeps one statistics row per user: the one with the most speeches, then the newest
+DEDUPE_USER_STATISTICS_QUERY = '''
+    DELETE s FROM user_statistics s
+    JOIN user_statistics keep
+      ON keep.user_id = s.user_id
+     AND (COALESCE(keep.total_speeches, 0), keep.id) > (COALESCE(s.total_speeches, 0), s.id)
+'''
+
+# Statements that must run before an index can be added to existing data: index name -> query
+INDEX_PREPARATION = {
+    'uq_up_user_level': DEDUPE_USER_PROGRESS_QUERY,
+    'uq_us_user': DEDUPE_USER_STATISTICS_QUERY,
+}
+
+# Secondary indexes for the hot lookup paths: (table, index name, definition)
+INDEXES = [
+    # Unique so finalize_upload can upsert progress rows
+    ('user_progress', 'uq_up_user_level', 'UNIQUE INDEX uq_up_user_level (user_id, level_id)'),
+    ('users', 'idx_users_active', 'INDEX idx_users_active (username, is_active)'),
+    # Unique so the first speech's statistics row can be upserted
+    ('user_statistics', 'uq_us_user', 'UNIQUE INDEX uq_us_user (user_id)'),
+    ('user_statistics', 'idx_us_leaderboard',
+     'INDEX idx_us_leaderboard (best_level_completed DESC, avg_flow_score DESC)'),
+    ('tasks', 'idx_tasks_level_order', 'INDEX idx_tasks_level_order (level_id, order_index, id)'),
+    ('speech_responses', 'idx_sr_user_created_id',
+     'INDEX idx_sr_user_created_id (user_id, created_at DESC, id DESC)'),
+]
+
+# Indexes superseded by an entry in INDEXES, dropped once it exists: (table, index name)
+RETIRED_INDEXES = [
+    ('user_statistics', 'idx_us_user'),
+]
+
 class DatabaseManager:
     def __init__(self):
         self.config = Config()
-        self.connection = None
+        self.pool = None
+        self.tuple_cursor = None
         self.connect()
-        self.create_tables()
 
     def connect(self):
+        import orjson
+        import pymysql
+        from dbutils.pooled_db import PooledDB
+        from pymysql.constants import FIELD_TYPE
+        from pymysql.converters import conversions as default_conversions
+
+        def decode_json(value):
+            # One malformed document must not fail the whole result set
+            try:
+                return orjson.loads(value)
+            except orjson.JSONDecodeError:
+                logger.warning("Undecodable JSON column value; returning {}")
+                return {}
+
+        # Decode JSON columns (speech_responses.ai_feedback) into dicts as rows are read
+        conversions = default_conversions.copy()
+        conversions[FIELD_TYPE.JSON] = decode_json
+        
         try:
-            self.connection = pymysql.connect(
+            self.pool = PooledDB(
+                creator=pymysql,
+                mincached=self.config.DB_POOL_MIN_CACHED,
+                maxcached=self.config.DB_POOL_MAX_CACHED,
+                maxconnections=self.config.DB_POOL_MAX_CONNECTIONS,
+                blocking=True,
+                # Ping on checkout so connections dropped by wait_timeout are reopened
+                ping=1,
                 host=self.config.MYSQL_HOST,
                 user=self.config.MYSQL_USER,
                 password=self.config.MYSQL_PASSWORD,
                 database=self.config.MYSQL_DB,
-                cursorclass=pymysql.cursors.DictCursor
+                cursorclass=pymysql.cursors.DictCursor,
+                conv=conversions,
+                # Statements commit on their own, so reads skip a COMMIT round-trip
+                autocommit=True
             )
-            logger.info("Database connection established")
+            # Plain tuple rows for callers that don't need column names
+            self.tuple_cursor = pymysql.cursors.Cursor
+            logger.info("Database connection pool established")
         except Exception as e:
             logger.error(f"Database connection failed: {e}")
             raise
 
+    def schema_is_current(self):
+        """Cheap boot-time check; migrations themselves only run through `flask db init`"""
+        # The most recently added column marks an up-to-date schema
+        marker_table, marker_column, _ = ADDED_COLUMNS[-1]
+        marker = self.execute_single_query('''
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        ''', (marker_table, marker_column), cursor_class=self.tuple_cursor)
+        # ...and so do the newest table and unique key
+        jobs_table = self.execute_single_query('''
+            SELECT 1 FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_name = 'speech_jobs'
+        ''', cursor_class=self.tuple_cursor)
+        statistics_key = self.execute_single_query('''
+            SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = 'user_statistics'
+              AND index_name = 'uq_us_user'
+            LIMIT 1
+        ''', cursor_class=self.tuple_cursor)
+        return bool(marker and jobs_table and statistics_key)
+
     def create_tables(self):
         try:
-            cursor = self.connection.cursor()
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
             
-            # Users table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    username VARCHAR(80) UNIQUE NOT NULL,
-                    email VARCHAR(120) UNIQUE NOT NULL,
-                    password_hash VARCHAR(255) NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT TRUE
-                )
-            ''')
-            
-            # Levels table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS levels (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    level_number INT UNIQUE NOT NULL,
-                    title VARCHAR(200) NOT NULL,
-                    description TEXT,
-                    difficulty ENUM('easy', 'medium', 'hard') DEFAULT 'easy',
-                    is_active BOOLEAN DEFAULT TRUE
-                )
-            ''')
-            
-            # Tasks table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS tasks (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    level_id INT,
-                    task_type ENUM('analogy', 'story', 'presentation') NOT NULL,
-                    prompt TEXT NOT NULL,
-                    example_response TEXT,
-                    order_index INT DEFAULT 0,
-                    FOREIGN KEY (level_id) REFERENCES levels(id)
-                )
-            ''')
-            
-            # User progress table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_progress (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    user_id INT,
-                    level_id INT,
-                    is_completed BOOLEAN DEFAULT FALSE,
-                    completed_at TIMESTAMP NULL,
-                    score INT DEFAULT 0,
-                    FOREIGN KEY (user_id) REFERENCES users(id),
-                    FOREIGN KEY (level_id) REFERENCES levels(id)
-                )
-            ''')
-            
-            # Speech responses table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS speech_responses (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    user_id INT,
-                    level_number INT,
-                    task_id INT,
-                    transcription TEXT,
-                    ai_feedback JSON,
-                    audio_duration FLOAT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_quick_task BOOLEAN DEFAULT FALSE,
-                    FOREIGN KEY (user_id) REFERENCES users(id),
-                    FOREIGN KEY (task_id) REFERENCES tasks(id)
-                )
-            ''')
-            
-            # User statistics table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_statistics (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    user_id INT,
-                    total_speeches INT DEFAULT 0,
-                    avg_filler_count FLOAT DEFAULT 0,
-                    avg_repetition_score FLOAT DEFAULT 0,
-                    avg_flow_score FLOAT DEFAULT 0,
-                    best_level_completed INT DEFAULT 0,
-                    last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(id)
-                )
-            ''')
-            
-            self.connection.commit()
+                # Users table
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS users (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        username VARCHAR(80) UNIQUE NOT NULL,
+                        email VARCHAR(120) UNIQUE NOT NULL,
+                        password_hash VARCHAR(255) NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        is_active BOOLEAN DEFAULT TRUE
+                    )
+                ''')
+            
+                # Levels table
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS levels (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        level_number INT UNIQUE NOT NULL,
+                        title VARCHAR(200) NOT NULL,
+                        description TEXT,
+                        difficulty ENUM('easy', 'medium', 'hard') DEFAULT 'easy',
+                        is_active BOOLEAN DEFAULT TRUE
+                    )
+                ''')
+            
+                # Tasks table
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS tasks (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        level_id INT,
+                        task_type ENUM('analogy', 'story', 'presentation') NOT NULL,
+                        prompt TEXT NOT NULL,
+                        example_response TEXT,
+                        order_index INT DEFAULT 0,
+                        FOREIGN KEY (level_id) REFERENCES levels(id)
+                    )
+                ''')
+            
+                # User progress table
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS user_progress (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        user_id INT,
+                        level_id INT,
+                        is_completed BOOLEAN DEFAULT FALSE,
+                        completed_at TIMESTAMP NULL,
+                        score INT DEFAULT 0,
+                        FOREIGN KEY (user_id) REFERENCES users(id),
+                        FOREIGN KEY (level_id) REFERENCES levels(id)
+                    )
+                ''')
+            
+                # Speech responses table
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS speech_responses (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        user_id INT,
+                        level_number INT,
+                        task_id INT,
+                        transcription TEXT,
+                        ai_feedback JSON,
+                        audio_duration FLOAT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        is_quick_task BOOLEAN DEFAULT FALSE,
+                        FOREIGN KEY (user_id) REFERENCES users(id),
+                        FOREIGN KEY (task_id) REFERENCES tasks(id)
+                    )
+                ''')
+            
+                # User statistics table
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS user_statistics (
+                        id INT AUTO_INCREMENT PRIMARY KEY,
+                        user_id INT,
+                        total_speeches INT DEFAULT 0,
+                        avg_filler_count FLOAT DEFAULT 0,
+                        avg_repetition_score FLOAT DEFAULT 0,
+                        avg_flow_score FLOAT DEFAULT 0,
+                        best_level_completed INT DEFAULT 0,
+                        last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (user_id) REFERENCES users(id)
+                    )
+                ''')
+            
+                # Upload jobs, shared by every worker process that may answer a poll
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS speech_jobs (
+                        id CHAR(32) PRIMARY KEY,
+                        user_id INT NOT NULL,
+                        status ENUM('pending', 'completed', 'failed') DEFAULT 'pending',
+                        result JSON NULL,
+                        error VARCHAR(255) NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                        INDEX idx_sj_created (created_at),
+                        FOREIGN KEY (user_id) REFERENCES users(id)
+                    )
+                ''')
+            
+                self.add_columns(cursor)
+                self.create_indexes(cursor)
             logger.info("Database tables created/verified")
             
             # Insert default levels
@@ -122,96 +241,170 @@ class DatabaseManager:
             logger.error(f"Error creating tables: {e}")
             raise
 
+    def add_columns(self, cursor):
+        """Add columns introduced after the original schema and backfill them from ai_feedback"""
+        for table, column, definition in ADDED_COLUMNS:
+            cursor.execute('''
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+            ''', (table, column))
+            
+            if not cursor.fetchone():
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                cursor.execute(f'''
+                    UPDATE {table}
+                    SET {column} = ROUND(JSON_EXTRACT(ai_feedback, '$.{column}'))
+                    WHERE ai_feedback IS NOT NULL
+                      AND JSON_TYPE(JSON_EXTRACT(ai_feedback, '$.{column}')) IN ('INTEGER', 'DOUBLE', 'DECIMAL')
+                ''')
+                logger.info(f"Added column {column} to {table}")
+
+    def create_indexes(self, cursor):
+        """Add any missing secondary indexes; existing tables are altered in place"""
+        altered_tables = set()
+        for table, index_name, definition in INDEXES:
+            cursor.execute('''
+                SELECT 1 FROM information_schema.statistics
+                WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+                LIMIT 1
+            ''', (table, index_name))
+            
+            if not cursor.fetchone():
+                if index_name in INDEX_PREPARATION:
+                    removed = cursor.execute(INDEX_PREPARATION[index_name])
+                    if removed:
+                        logger.info(f"Removed {removed} rows from {table} that conflict with {index_name}")
+                cursor.execute(f"ALTER TABLE {table} ADD {definition}")
+                altered_tables.add(table)
+                logger.info(f"Created index {index_name} on {table}")
+        
+        for table, index_name in RETIRED_INDEXES:
+            cursor.execute('''
+                SELECT 1 FROM information_schema.statistics
+                WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+                LIMIT 1
+            ''', (table, index_name))
+            
+            if cursor.fetchone():
+                cursor.execute(f"ALTER TABLE {table} DROP INDEX {index_name}")
+                altered_tables.add(table)
+                logger.info(f"Dropped index {index_name} from {table}")
+        
+        # Refresh optimizer statistics so the new indexes are picked up
+        if altered_tables:
+            cursor.execute(f"ANALYZE TABLE {', '.join(sorted(altered_tables))}")
+            cursor.fetchall()
+
     def insert_default_levels(self):
-        cursor = self.connection.cursor()
+        with self.pool.connection() as conn:
+            # Seed levels and tasks in one transaction
+            conn.begin()
+            cursor = conn.cursor()
         
-        levels = [
-            (1, "Introduction Basics", "Learn to introduce yourself confidently", "easy"),
-            (2, "Storytelling Fundamentals", "Master the art of compelling narratives", "easy"),
-            (3, "Business Analogies", "Create powerful business comparisons", "medium"),
-            (4, "Persuasive Speaking", "Develop convincing arguments", "medium"),
-            (5, "Advanced Presentations", "Master complex presentation skills", "hard")
-        ]
+            levels = [
+                (1, "Introduction Basics", "Learn to introduce yourself confidently", "easy"),
+                (2, "Storytelling Fundamentals", "Master the art of compelling narratives", "easy"),
+                (3, "Business Analogies", "Create powerful business comparisons", "medium"),
+                (4, "Persuasive Speaking", "Develop convincing arguments", "medium"),
+                (5, "Advanced Presentations", "Master complex presentation skills", "hard")
+            ]
         
-        for level in levels:
-            cursor.execute('''
+            cursor.executemany('''
                 INSERT IGNORE INTO levels (level_number, title, description, difficulty)
                 VALUES (%s, %s, %s, %s)
-            ''', level)
-        
-        # Insert tasks for each level - Fixed to prevent duplicates
-        tasks = [
-            # Level 1 tasks
-            (1, "analogy", "Complete this sentence: 'Learning is like...'", "Learning is like riding a bicycle because once you get the hang of it, you never forget.", 1),
-            (1, "analogy", "Complete this sentence: 'Friendship is like...'", "Friendship is like a garden because it needs constant care to flourish.", 2),
-            (1, "story", "Tell us about yourself in 30 seconds", "Hi, I'm [name], and I believe every challenge is an opportunity to grow.", 3),
-            (1, "analogy", "Complete this sentence: 'Time is like...'", "Time is like water because it flows constantly and cannot be held back.", 4),
-            
-            # Level 2 tasks
-            (2, "story", "Tell a story about overcoming a challenge", "Share a personal experience that shaped who you are today.", 1),
-            (2, "analogy", "Complete this sentence: 'Success is like...'", "Success is like climbing a mountain because the view from the top makes all the effort worthwhile.", 2),
-            (2, "story", "Describe a moment when you helped someone", "Talk about a time when your actions made a positive difference.", 3),
-            (2, "analogy", "Complete this sentence: 'Dreams are like...'", "Dreams are like seeds because they need nurturing to grow into reality.", 4),
-            
-            # Level 3 tasks
-            (3, "analogy", "Complete this sentence: 'Business is like...'", "Business is like running a marathon because you need endurance and strategy to reach the finish line.", 1),
-            (3, "presentation", "Pitch a simple business idea in 60 seconds", "Present your idea with problem, solution, and benefits.", 2),
-            (3, "analogy", "Complete this sentence: 'Leadership is like...'", "Leadership is like conducting an orchestra because you must bring harmony from different talents.", 3),
-            (3, "presentation", "Explain why teamwork matters in business", "Discuss the value of collaboration with specific examples.", 4),
-            
-            # Level 4 tasks
-            (4, "presentation", "Argue for or against remote work", "Present a compelling case with evidence and examples.", 1),
-            (4, "story", "Share a leadership experience", "Describe a time you led others through difficulty.", 2),
-            (4, "presentation", "Convince someone to try a new hobby", "Use persuasive techniques to make your case compelling.", 3),
-            (4, "analogy", "Complete this sentence: 'Innovation is like...'", "Innovation is like cooking because it combines existing ingredients in new ways.", 4),
-            
-            # Level 5 tasks
-            (5, "presentation", "Present a 3-minute impromptu speech", "Topic will be given 30 seconds before you start.", 1),
-            (5, "story", "Deliver an inspiring message", "Motivate others with your words and conviction.", 2),
-            (5, "presentation", "Explain a complex concept simply", "Break down a difficult topic for a general audience.", 3),
-            (5, "presentation", "Give a professional elevator pitch", "Present yourself or your ideas in 2 minutes or less.", 4)
-        ]
+            ''', levels)
         
-        # Clear existing tasks to prevent duplicates (for development)
-        cursor.execute('DELETE FROM tasks')
-        
-        for task_data in tasks:
-            level_number, task_type, prompt, example, order_index = task_data
-            cursor.execute('''
-                SELECT id FROM levels WHERE level_number = %s
-            ''', (level_number,))
-            level_result = cursor.fetchone()
+            # Insert tasks for each level - Fixed to prevent duplicates
+            tasks = [
+                # Level 1 tasks
+                (1, "analogy", "Complete this sentence: 'Learning is like...'", "Learning is like riding a bicycle because once you get the hang of it, you never forget.", 1),
+                (1, "analogy", "Complete this sentence: 'Friendship is like...'", "Friendship is like a garden because it needs constant care to flourish.", 2),
+                (1, "story", "Tell us about yourself in 30 seconds", "Hi, I'm [name], and I believe every challenge is an opportunity to grow.", 3),
+                (1, "analogy", "Complete this sentence: 'Time is like...'", "Time is like water because it flows constantly and cannot be held back.", 4),
             
-            if level_result:
-                cursor.execute('''
+                # Level 2 tasks
+                (2, "story", "Tell a story about overcoming a challenge", "Share a personal experience that shaped who you are today.", 1),
+                (2, "analogy", "Complete this sentence: 'Success is like...'", "Success is like climbing a mountain because the view from the top makes all the effort worthwhile.", 2),
+                (2, "story", "Describe a moment when you helped someone", "Talk about a time when your actions made a positive difference.", 3),
+                (2, "analogy", "Complete this sentence: 'Dreams are like...'", "Dreams are like seeds because they need nurturing to grow into reality.", 4),
+            
+                # Level 3 tasks
+                (3, "analogy", "Complete this sentence: 'Business is like...'", "Business is like running a marathon because you need endurance and strategy to reach the finish line.", 1),
+                (3, "presentation", "Pitch a simple business idea in 60 seconds", "Present your idea with problem, solution, and benefits.", 2),
+                (3, "analogy", "Complete this sentence: 'Leadership is like...'", "Leadership is like conducting an orchestra because you must bring harmony from different talents.", 3),
+                (3, "presentation", "Explain why teamwork matters in business", "Discuss the value of collaboration with specific examples.", 4),
+            
+                # Level 4 tasks
+                (4, "presentation", "Argue for or against remote work", "Present a compelling case with evidence and examples.", 1),
+                (4, "story", "Share a leadership experience", "Describe a time you led others through difficulty.", 2),
+                (4, "presentation", "Convince someone to try a new hobby", "Use persuasive techniques to make your case compelling.", 3),
+                (4, "analogy", "Complete this sentence: 'Innovation is like...'", "Innovation is like cooking because it combines existing ingredients in new ways.", 4),
+            
+                # Level 5 tasks
+                (5, "presentation", "Present a 3-minute impromptu speech", "Topic will be given 30 seconds before you start.", 1),
+                (5, "story", "Deliver an inspiring message", "Motivate others with your words and conviction.", 2),
+                (5, "presentation", "Explain a complex concept simply", "Break down a difficult topic for a general audience.", 3),
+                (5, "presentation", "Give a professional elevator pitch", "Present yourself or your ideas in 2 minutes or less.", 4)
+            ]
+        
+            # Seed tasks only once so restarts don't rewrite the table
+            cursor.execute('SELECT COUNT(*) AS task_count FROM tasks')
+            if cursor.fetchone()['task_count'] == 0:
+                cursor.execute('SELECT level_number, id FROM levels')
+                level_ids = {row['level_number']: row['id'] for row in cursor.fetchall()}
+                
+                cursor.executemany('''
                     INSERT INTO tasks (level_id, task_type, prompt, example_response, order_index)
                     VALUES (%s, %s, %s, %s, %s)
-                ''', (level_result['id'], task_type, prompt, example, order_index))
+                ''', [
+                    (level_ids[level_number], task_type, prompt, example, order_index)
+                    for level_number, task_type, prompt, example, order_index in tasks
+                    if level_number in level_ids
+                ])
         
-        self.connection.commit()
+            conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        """Yield a cursor whose statements commit together, rolling back if the block raises"""
+        with self.pool.connection() as conn:
+            conn.begin()
+            try:
+                with conn.cursor() as cursor:
+                    yield cursor
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
 
     def execute_query(self, query, params=None):
-        cursor = self.connection.cursor()
-        cursor.execute(query, params)
-        result = cursor.fetchall()
-        self.connection.commit()
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                result = cursor.fetchall()
         return result
 
-    def execute_single_query(self, query, params=None):
-        cursor = self.connection.cursor()
-        cursor.execute(query, params)
-        result = cursor.fetchone()
-        self.connection.commit()
+    def execute_single_query(self, query, params=None, cursor_class=None):
+        with self.pool.connection() as conn:
+            with (conn.cursor(cursor_class) if cursor_class else conn.cursor()) as cursor:
+                cursor.execute(query, params)
+                result = cursor.fetchone()
         return result
 
+    def execute_update(self, query, params=None):
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                row_count = cursor.execute(query, params)
+        return row_count
+
     def insert_query(self, query, params=None):
-        cursor = self.connection.cursor()
-        cursor.execute(query, params)
-        insert_id = cursor.lastrowid
-        self.connection.commit()
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                insert_id = cursor.lastrowid
         return insert_id
 
     def close(self):
-        if self.connection:
-            self.connection.close()
-            logger.info("Database connection closed")
\ No newline at end of file
+        if self.pool:
+            self.pool.close()
+            logger.info("Database connection pool closed")
\ No newline at end of file
@@ -1,33 +1,99 @@
+from cachetools import TTLCache
+from datetime import datetime
 import json
 import logging
+import operator
+import threading
+
+from managers.auth_manager import UPSERT_STATISTICS_QUERY, numeric_score, statistics_params
 
 logger = logging.getLogger(__name__)
 
+LEVEL_DETAIL_COLUMNS = ('id', 'level_number', 'title', 'description', 'difficulty',
+                        'is_active', 'is_completed', 'score', 'completed_at')
+
+# ai_feedback fields also stored as speech_responses columns
+FEEDBACK_SCORE_KEYS = ('repetition_score', 'flow_score', 'confidence_score',
+                       'filler_count', 'weak_words_count')
+FEEDBACK_SCORE_DEFAULTS = dict.fromkeys(FEEDBACK_SCORE_KEYS, 0)
+get_feedback_scores = operator.itemgetter(*FEEDBACK_SCORE_KEYS)
+
+PASSING_SCORE = 60
+HISTORY_CURSOR_FORMAT = '%Y%m%d%H%M%S'  # created_at part of a speech history cursor
+SPEECH_JOB_TTL = 15 * 60  # seconds a job row is kept before it is purged
+SPEECH_JOB_ERROR_LENGTH = 255  # speech_jobs.error is VARCHAR(255)
+FAIL_SPEECH_JOB_QUERY = '''
+    UPDATE speech_jobs SET status = 'failed', error = %s WHERE id = %s
+'''
+
+INSERT_SPEECH_RESPONSE_QUERY = '''
+    INSERT INTO speech_responses 
+    (user_id, level_number, task_id, transcription, ai_feedback, audio_duration, is_quick_task,
+     repetition_score, flow_score, confidence_score, filler_count, weak_words_count)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+'''
+# Insert or update the progress row in one statement
+UPSERT_PROGRESS_QUERY = '''
+    INSERT INTO user_progress (user_id, level_id, is_completed, completed_at, score)
+    VALUES (%s, %s, TRUE, CURRENT_TIMESTAMP, %s)
+    ON DUPLICATE KEY UPDATE
+        is_completed = TRUE, completed_at = CURRENT_TIMESTAMP, score = VALUES(score)
+'''
+BEST_LEVEL_QUERY = '''
+    UPDATE user_statistics 
+    SET best_level_completed = GREATEST(best_level_completed, %s)
+    WHERE user_id = %s
+'''
+
+def speech_response_params(user_id, level_number, task_id, transcription, ai_feedback, audio_duration, is_quick_task):
+    """Parameters for INSERT_SPEECH_RESPONSE_QUERY, with the score fields rounded into their columns"""
+    scores = tuple(
+        round(value) if isinstance(value, (int, float)) else None
+        for value in (ai_feedback.get(key) for key in FEEDBACK_SCORE_KEYS)
+    )
+    return (user_id, level_number, task_id, transcription, json.dumps(ai_feedback), audio_duration,
+            is_quick_task) + scores
+
 class GameManager:
     def __init__(self, db_manager):
         self.db = db_manager
+        # Leaderboard snapshots keyed by limit, refreshed after 60s or a level completion
+        self._leaderboard_cache = TTLCache(maxsize=16, ttl=60)
+        self._leaderboard_lock = threading.Lock()
+        # Level rows rarely change; cache them and only query per-user progress.
+        # Edits to the levels table show up in every worker once the TTL expires.
+        self._levels_cache = TTLCache(maxsize=1, ttl=300)
+        self._levels_lock = threading.Lock()
 
     def get_level_details(self, level_number, user_id):
         try:
-            level = self.db.execute_single_query('''
-                SELECT l.*, COALESCE(up.is_completed, FALSE) as is_completed,
-                       up.score, up.completed_at
+            # One round-trip: a row per task, with the level columns repeated
+            rows = self.db.execute_query('''
+                SELECT l.id, l.level_number, l.title, l.description, l.difficulty, l.is_active,
+                       COALESCE(up.is_completed, FALSE) as is_completed,
+                       up.score, up.completed_at,
+                       t.id as task_id, t.task_type, t.prompt, t.example_response, t.order_index
                 FROM levels l
                 LEFT JOIN user_progress up ON l.id = up.level_id AND up.user_id = %s
+                LEFT JOIN tasks t ON t.level_id = l.id
                 WHERE l.level_number = %s AND l.is_active = TRUE
+                ORDER BY t.order_index, t.id
             ''', (user_id, level_number))
             
-            if not level:
+            if not rows:
                 return None
             
-            tasks = self.db.execute_query('''
-                SELECT id, task_type, prompt, example_response, order_index
-                FROM tasks
-                WHERE level_id = %s
-                ORDER BY order_index, id
-            ''', (level['id'],))
-            
-            level['tasks'] = tasks
+            level = {key: rows[0][key] for key in LEVEL_DETAIL_COLUMNS}
+            level['tasks'] = [
+                {
+                    'id': row['task_id'],
+                    'task_type': row['task_type'],
+                    'prompt': row['prompt'],
+                    'example_response': row['example_response'],
+                    'order_index': row['order_index']
+                }
+                for row in rows if row['task_id'] is not None
+            ]
             return level
             
         except Exception as e:
@@ -36,15 +102,27 @@ class GameManager:
 
     def get_all_levels(self, user_id):
         try:
-            levels = self.db.execute_query('''
-                SELECT l.level_number, l.title, l.description, l.difficulty,
-                       COALESCE(up.is_completed, FALSE) as is_completed,
-                       up.score, up.completed_at
-                FROM levels l
-                LEFT JOIN user_progress up ON l.id = up.level_id AND up.user_id = %s
-                WHERE l.is_active = TRUE
-                ORDER BY l.level_number
-            ''', (user_id,))
+            progress = {
+                row['level_id']: row
+                for row in self.db.execute_query('''
+                    SELECT level_id, is_completed, score, completed_at
+                    FROM user_progress
+                    WHERE user_id = %s
+                ''', (user_id,))
+            }
+            
+            levels = []
+            for level in self._active_levels():
+                level_progress = progress.get(level['id'], {})
+                levels.append({
+                    'level_number': level['level_number'],
+                    'title': level['title'],
+                    'description': level['description'],
+                    'difficulty': level['difficulty'],
+                    'is_completed': level_progress.get('is_completed') or 0,
+                    'score': level_progress.get('score'),
+                    'completed_at': level_progress.get('completed_at')
+                })
             
             return levels
             
@@ -52,84 +130,86 @@ class GameManager:
             logger.error(f"Get all levels error: {e}")
             return []
 
-    def save_speech_response(self, user_id, level_number, task_id, transcription, ai_feedback, audio_duration, is_quick_task=False):
+    def _active_levels(self):
+        with self._levels_lock:
+            levels = self._levels_cache.get('levels')
+        
+        if levels is None:
+            levels = self.db.execute_query('''
+                SELECT id, level_number, title, description, difficulty
+                FROM levels
+                WHERE is_active = TRUE
+                ORDER BY level_number
+            ''')
+            with self._levels_lock:
+                self._levels_cache['levels'] = levels
+        return levels
+
+    def finalize_upload(self, user_id, level_number, task_id, transcription, ai_feedback, audio_duration, is_quick_task=False):
+        """Save the response, update statistics and record a passing level in one transaction.
+        
+        Returns (response_id, level_completed), or (None, False) if nothing was written.
+        """
         try:
-            response_id = self.db.insert_query('''
-                INSERT INTO speech_responses 
-                (user_id, level_number, task_id, transcription, ai_feedback, audio_duration, is_quick_task)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ''', (user_id, level_number, task_id, transcription, json.dumps(ai_feedback), audio_duration, is_quick_task))
+            level_completed = False
+            # Resolved up front: the upsert's affected-row count is 0 for an unchanged row, so it
+            # cannot tell a missing level apart from a repeat completion
+            level_id = None
+            if not is_quick_task and level_number:
+                level_id = next((level['id'] for level in self._active_levels()
+                                 if level['level_number'] == level_number), None)
             
-            logger.info(f"Speech response saved with ID: {response_id}")
-            return response_id
+            with self.db.transaction() as cursor:
+                cursor.execute(INSERT_SPEECH_RESPONSE_QUERY, speech_response_params(
+                    user_id, level_number, task_id, transcription, ai_feedback, audio_duration, is_quick_task
+                ))
+                response_id = cursor.lastrowid
+                
+                cursor.execute(UPSERT_STATISTICS_QUERY, statistics_params(user_id, ai_feedback))
+                
+                if level_id is not None:
+                    score = self.calculate_level_score(ai_feedback)
+                    if score >= PASSING_SCORE:
+                        cursor.execute(UPSERT_PROGRESS_QUERY, (user_id, level_id, score))
+                        cursor.execute(BEST_LEVEL_QUERY, (level_number, user_id))
+                        level_completed = True
             
-        except Exception as e:
-            logger.error(f"Save speech response error: {e}")
-            return None
-
-    def complete_level(self, user_id, level_number, score):
-        try:
-            level = self.db.execute_single_query(
-                "SELECT id FROM levels WHERE level_number = %s",
-                (level_number,)
-            )
+            if level_completed:
+                with self._leaderboard_lock:
+                    self._leaderboard_cache.clear()
+                logger.info(f"Level {level_number} completed for user {user_id}")
             
-            if not level:
-                return False
-            
-            # Check if progress already exists
-            existing_progress = self.db.execute_single_query('''
-                SELECT id FROM user_progress 
-                WHERE user_id = %s AND level_id = %s
-            ''', (user_id, level['id']))
-            
-            if existing_progress:
-                # Update existing progress
-                self.db.execute_query('''
-                    UPDATE user_progress 
-                    SET is_completed = TRUE, completed_at = CURRENT_TIMESTAMP, score = %s
-                    WHERE user_id = %s AND level_id = %s
-                ''', (score, user_id, level['id']))
-            else:
-                # Insert new progress
-                self.db.insert_query('''
-                    INSERT INTO user_progress (user_id, level_id, is_completed, completed_at, score)
-                    VALUES (%s, %s, TRUE, CURRENT_TIMESTAMP, %s)
-                ''', (user_id, level['id'], score))
-            
-            # Update user statistics
-            self.db.execute_query('''
-                UPDATE user_statistics 
-                SET best_level_completed = GREATEST(best_level_completed, %s)
-                WHERE user_id = %s
-            ''', (level_number, user_id))
-            
-            logger.info(f"Level {level_number} completed for user {user_id}")
-            return True
+            logger.info(f"Speech response saved with ID: {response_id}")
+            return response_id, level_completed
             
         except Exception as e:
-            logger.error(f"Complete level error: {e}")
-            return False
+            logger.error(f"Finalize upload error: {e}")
+            return None, False
 
-    def get_user_speech_history(self, user_id, limit=10):
+    def get_user_speech_history(self, user_id, limit=10, after_cursor=None):
+        """Most recent responses first; pass after_cursor from next_history_cursor() for the next page"""
         try:
-            history = self.db.execute_query('''
+            conditions = "sr.user_id = %s"
+            params = [user_id]
+            seek = self._parse_history_cursor(after_cursor) if after_cursor else None
+            if seek:
+                # Keyset pagination: seek past the last row instead of scanning with OFFSET.
+                # Spelled out because MySQL won't range-scan a row-constructor comparison
+                # after the user_id equality prefix
+                created_at, response_id = seek
+                conditions += " AND (sr.created_at < %s OR (sr.created_at = %s AND sr.id < %s))"
+                params.extend((created_at, created_at, response_id))
+            params.append(limit)
+            
+            history = self.db.execute_query(f'''
                 SELECT sr.*, t.prompt, l.title as level_title
                 FROM speech_responses sr
                 LEFT JOIN tasks t ON sr.task_id = t.id
                 LEFT JOIN levels l ON t.level_id = l.id
-                WHERE sr.user_id = %s
-                ORDER BY sr.created_at DESC
+                WHERE {conditions}
+                ORDER BY sr.created_at DESC, sr.id DESC
                 LIMIT %s
-            ''', (user_id, limit))
-            
-            # Parse JSON feedback
-            for record in history:
-                if record['ai_feedback']:
-                    try:
-                        record['ai_feedback'] = json.loads(record['ai_feedback'])
-                    except:
-                        record['ai_feedback'] = {}
+            ''', params)
             
             return history
             
@@ -137,16 +217,31 @@ class GameManager:
             logger.error(f"Get speech history error: {e}")
             return []
 
+    def next_history_cursor(self, history, limit):
+        """Cursor for the page after `history`, or None when it was the last one"""
+        if len(history) < limit:
+            return None
+        last = history[-1]
+        return f"{last['created_at'].strftime(HISTORY_CURSOR_FORMAT)}-{last['id']}"
+
+    def _parse_history_cursor(self, cursor):
+        """(created_at, id) from a next_history_cursor() value, or None if it is malformed"""
+        try:
+            created_at, response_id = cursor.split('-')
+            return datetime.strptime(created_at, HISTORY_CURSOR_FORMAT), int(response_id)
+        except ValueError:
+            return None
+
     def calculate_level_score(self, ai_feedback):
         try:
             # Calculate composite score from AI feedback
-            repetition_score = ai_feedback.get('repetition_score', 0)
-            flow_score = ai_feedback.get('flow_score', 0)
-            confidence_score = ai_feedback.get('confidence_score', 0)
+            (repetition_score, flow_score, confidence_score,
+             filler_count, weak_words_count) = map(
+                numeric_score, get_feedback_scores({**FEEDBACK_SCORE_DEFAULTS, **ai_feedback}))
             
             # Penalize for excessive fillers and weak words
-            filler_penalty = min(ai_feedback.get('filler_count', 0) * 2, 20)
-            weak_words_penalty = min(ai_feedback.get('weak_words_count', 0) * 3, 15)
+            filler_penalty = min(filler_count * 2, 20)
+            weak_words_penalty = min(weak_words_count * 3, 15)
             
             total_score = (repetition_score + flow_score + confidence_score) / 3
             total_score = max(0, total_score - filler_penalty - weak_words_penalty)
@@ -162,22 +257,59 @@ class GameManager:
             if level_number == 1:
                 return True
             
-            # Check if previous level is completed
-            previous_level = self.db.execute_single_query('''
-                SELECT up.is_completed
-                FROM user_progress up
-                JOIN levels l ON up.level_id = l.id
-                WHERE up.user_id = %s AND l.level_number = %s
-            ''', (user_id, level_number - 1))
+            # Levels unlock in order, so the highest completed level decides
+            stats = self.db.execute_single_query(
+                "SELECT best_level_completed FROM user_statistics WHERE user_id = %s",
+                (user_id,),
+                cursor_class=self.db.tuple_cursor
+            )
             
-            return previous_level and previous_level['is_completed']
+            return bool(stats) and stats[0] >= level_number - 1
             
         except Exception as e:
             logger.error(f"Check level unlock error: {e}")
             return False
 
+    def create_speech_job(self, job_id, user_id):
+        """Record a pending upload job; jobs live in the database so any worker can answer its poll"""
+        self.db.execute_update('''
+            DELETE FROM speech_jobs WHERE created_at < NOW() - INTERVAL %s SECOND
+        ''', (SPEECH_JOB_TTL,))
+        self.db.execute_update('''
+            INSERT INTO speech_jobs (id, user_id, status) VALUES (%s, %s, 'pending')
+        ''', (job_id, user_id))
+
+    def finish_speech_job(self, job_id, result=None, error=None):
+        """Record a speech job's outcome for the polling endpoint"""
+        try:
+            if error:
+                # Error text can wrap an arbitrary exception message; strict mode rejects overflow
+                self.db.execute_update(FAIL_SPEECH_JOB_QUERY, (error[:SPEECH_JOB_ERROR_LENGTH], job_id))
+            else:
+                self.db.execute_update('''
+                    UPDATE speech_jobs SET status = 'completed', result = %s WHERE id = %s
+                ''', (json.dumps(result), job_id))
+        except Exception as e:
+            logger.error(f"Finish speech job error: {e}")
+            # A job left pending would keep its client polling until it gives up
+            try:
+                self.db.execute_update(FAIL_SPEECH_JOB_QUERY, ('Processing failed. Please try again.', job_id))
+            except Exception as e:
+                logger.error(f"Fail speech job error: {e}")
+
+    def get_speech_job(self, job_id, user_id):
+        """The job's row if it belongs to user_id, else None"""
+        return self.db.execute_single_query('''
+            SELECT status, result, error FROM speech_jobs WHERE id = %s AND user_id = %s
+        ''', (job_id, user_id))
+
     def get_leaderboard(self, limit=10):
         try:
+            with self._leaderboard_lock:
+                leaderboard = self._leaderboard_cache.get(limit)
+            if leaderboard is not None:
+                return leaderboard
+            
             leaderboard = self.db.execute_query('''
                 SELECT u.username, us.best_level_completed, us.total_speeches,
                        us.avg_flow_score, us.last_activity
@@ -188,6 +320,8 @@ class GameManager:
                 LIMIT %s
             ''', (limit,))
             
+            with self._leaderboard_lock:
+                self._leaderboard_cache[limit] = leaderboard
             return leaderboard
             
         except Exception as e:
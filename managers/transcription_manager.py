@@ -1,61 +1,162 @@
+import functools
+import hashlib
+import io
+import json
+import mmap
+import mutagen
 import os
 import requests
+import struct
+import subprocess
+import threading
+import wave
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from cachetools import TTLCache
+from urllib3.util.retry import Retry
 import time
 import logging
 from config import Config
-from pydub import AudioSegment
 
 logger = logging.getLogger(__name__)
 
+WEBHOOK_HEADER_NAME = 'X-Hook-Token'
+REQUEST_TIMEOUT = 30  # seconds, for the JSON API calls
+UPLOAD_TIMEOUT = 60  # seconds
+
+# Status polls back off from POLL_INITIAL_DELAY by POLL_BACKOFF up to the cap
+POLL_INITIAL_DELAY = 0.3  # seconds
+POLL_BACKOFF = 1.5
+# The cap also applies with the webhook enabled: its callback may reach another worker process
+POLL_MAX_DELAY = 3  # seconds
+TRANSCRIPTION_TIMEOUT = 180  # seconds
+TRANSCRIPT_CACHE_TTL = 24 * 60 * 60  # seconds
+FFMPEG_TIMEOUT = 120  # seconds
+# AssemblyAI accepts WAV as-is; only recordings larger than this are shrunk to MP3 first
+TRANSCODE_MIN_BYTES = 10 * 1024 * 1024
+
+# Realtime streaming: the browser relays 16-bit mono PCM frames through /ws/transcribe
+REALTIME_URL = 'wss://api.assemblyai.com/v2/realtime/ws'
+STREAM_STOP_MESSAGE = 'stop'
+STREAM_CLOSE_TIMEOUT = 5  # seconds to wait for the last FinalTranscript after terminating
+STREAM_IDLE_TIMEOUT = 30  # seconds without a browser frame before the session is closed
+STREAM_RECEIVE_INTERVAL = 1  # seconds per browser receive, so a dead relay is noticed promptly
+
+# Bytes per read when hashing or uploading a file object. File objects are only ever read:
+# calling fileno() on a SpooledTemporaryFile rolls it over to a temp file on disk.
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Container magic bytes at the start of the file (WAV's RIFF....WAVE and MP4's
+# ....ftyp are not at offset 0 and are checked separately)
+AUDIO_SIGNATURES = (
+    ('mp3', b'ID3'),
+    ('ogg', b'OggS'),
+    ('webm', b'\x1a\x45\xdf\xa3'),  # EBML
+    ('flac', b'fLaC'),
+)
+AUDIO_SNIFF_SIZE = 12  # bytes
+
+# Canonical 44-byte PCM WAV header: RIFF chunk, 16-byte fmt chunk, data chunk header
+WAV_HEADER = struct.Struct('<4sI4s4sIHHIIHH4sI')
+# data sizes streaming encoders write before the length is known
+WAV_PLACEHOLDER_SIZES = (0, 0xFFFFFFFF)
+
+class UploadBody:
+    """Request body that streams a file object in chunks with a known Content-Length.
+    
+    requests sizes a plain file object through fileno(); given this, it uses len() instead.
+    """
+    def __init__(self, f, length):
+        self.f = f
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(functools.partial(self.f.read, READ_CHUNK_SIZE), b'')
+
+@functools.lru_cache(maxsize=1)
+def get_transcription_manager():
+    """Return the process-wide TranscriptionManager so its HTTP session, webhook waiters and caches are shared"""
+    return TranscriptionManager()
+
 class TranscriptionManager:
     def __init__(self):
         self.config = Config()
         self.api_token = self.config.ASSEMBLY_AI_KEY
         self.headers = {'authorization': self.api_token}
         self.base_url = 'https://api.assemblyai.com/v2'
+        # Keep-alive session so upload, create and polls reuse one TLS connection
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # Completed transcript payloads are large JSON that compresses well
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        ))
+        self.webhook_url = None
+        if self.config.PUBLIC_BASE_URL and self.config.ASSEMBLY_AI_WEBHOOK_TOKEN:
+            self.webhook_url = f"{self.config.PUBLIC_BASE_URL.rstrip('/')}/hooks/assemblyai"
+        # transcript_id -> Event set by the webhook when AssemblyAI finishes
+        self._completion_events = {}
+        self._completion_lock = threading.Lock()
+        # Audio digest -> transcription, so re-submitted recordings skip AssemblyAI
+        self._transcript_cache = TTLCache(maxsize=1024, ttl=TRANSCRIPT_CACHE_TTL)
+        self._transcript_cache_lock = threading.Lock()
 
-    def transcribe_audio(self, audio_file_path, content_type='audio/wav'):
+    def transcribe_audio(self, audio_file, content_type='audio/wav'):
+        """Transcribe a path or a seekable binary file, such as an upload's stream.
+        
+        The container is identified from its magic bytes; content_type is only used
+        when they are not recognised.
+        """
         try:
+            is_path = isinstance(audio_file, str)
             # Verify file exists and has content
-            if not os.path.exists(audio_file_path):
+            if is_path and not os.path.exists(audio_file):
                 return None, "Audio file not found"
             
-            file_size = os.path.getsize(audio_file_path)
+            file_size = self._audio_size(audio_file)
             if file_size == 0:
                 return None, "Audio file is empty"
             
-            logger.info(f"Processing audio file: {audio_file_path}, size: {file_size} bytes")
+            logger.info(f"Processing audio {audio_file if is_path else 'stream'}, size: {file_size} bytes")
+            
+            digest = self._audio_digest(audio_file)
+            with self._transcript_cache_lock:
+                cached_transcription = self._transcript_cache.get(digest)
+            if cached_transcription:
+                logger.info("Reusing cached transcription for identical audio")
+                return cached_transcription, None
+            
+            # Upload WAV directly; transcoding only pays off when it saves a lot of upload bandwidth
+            file_to_upload = audio_file
+            audio_format = self.sniff_audio_format(audio_file)
+            is_wav = audio_format == 'wav' if audio_format else content_type == 'audio/wav'
+            if is_wav and file_size > TRANSCODE_MIN_BYTES:
+                logger.info("Converting large WAV to MP3 before upload...")
+                mp3_audio = self._convert_wav_to_mp3(audio_file)
+                if mp3_audio:
+                    file_to_upload = mp3_audio
+                else:
+                    logger.warning("MP3 conversion failed, uploading the original WAV")
             
-            # Convert WAV to MP3 if needed
-            mp3_file_path = None
-            if content_type == 'audio/wav' or audio_file_path.lower().endswith('.wav'):
-                logger.info("Converting WAV to MP3 for AssemblyAI compatibility...")
-                mp3_file_path = self._convert_wav_to_mp3(audio_file_path)
-                if not mp3_file_path:
-                    return None, "Failed to convert WAV to MP3"
-                
-                # Use the MP3 file for transcription
-                file_to_upload = mp3_file_path
-                upload_content_type = 'audio/mpeg'
-            else:
-                file_to_upload = audio_file_path
-                upload_content_type = content_type
-            
-            # Upload the audio file (now MP3)
             audio_url = self._upload_audio_simple(file_to_upload)
             if not audio_url:
-                self._cleanup_temp_file(mp3_file_path)
                 return None, "Failed to upload audio"
             
             transcript_id = self._request_transcription(audio_url)
             if not transcript_id:
-                self._cleanup_temp_file(mp3_file_path)
                 return None, "Failed to start transcription"
             
             transcription = self._wait_for_completion(transcript_id)
             
-            # Clean up temporary MP3 file
-            self._cleanup_temp_file(mp3_file_path)
+            if transcription:
+                with self._transcript_cache_lock:
+                    self._transcript_cache[digest] = transcription
             
             return transcription, None
             
@@ -63,58 +164,91 @@ class TranscriptionManager:
             logger.error(f"Transcription error: {e}")
             return None, str(e)
 
-    def _convert_wav_to_mp3(self, wav_file_path):
-        """Convert WAV file to MP3 format"""
-        try:
-            # Generate MP3 filename
-            base_path = os.path.splitext(wav_file_path)[0]
-            mp3_file_path = f"{base_path}.mp3"
+    @contextmanager
+    def _open_audio(self, audio_file):
+        """Yield a binary file positioned at the start, opening paths and rewinding file objects"""
+        if isinstance(audio_file, str):
+            with open(audio_file, 'rb') as f:
+                yield f
+        else:
+            audio_file.seek(0)
+            try:
+                yield audio_file
+            finally:
+                audio_file.seek(0)
+
+    def _audio_size(self, audio_file):
+        if isinstance(audio_file, str):
+            return os.path.getsize(audio_file)
+        audio_file.seek(0, os.SEEK_END)
+        file_size = audio_file.tell()
+        audio_file.seek(0)
+        return file_size
+
+    def _audio_digest(self, audio_file):
+        """BLAKE2b digest of the audio bytes; files on disk are read through mmap to avoid copying"""
+        with self._open_audio(audio_file) as f:
+            if isinstance(audio_file, str):
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    return hashlib.blake2b(mapped).hexdigest()
             
-            logger.info(f"Converting {wav_file_path} to {mp3_file_path}")
+            digest = hashlib.blake2b()
+            for chunk in iter(functools.partial(f.read, READ_CHUNK_SIZE), b''):
+                digest.update(chunk)
+            return digest.hexdigest()
+
+    def _convert_wav_to_mp3(self, wav_file):
+        """Convert a WAV path or file object to MP3, returned in memory as a BytesIO"""
+        try:
+            is_path = isinstance(wav_file, str)
+            logger.info(f"Converting {wav_file if is_path else 'stream'} to MP3")
             
-            # Load WAV file and convert to MP3
-            audio = AudioSegment.from_wav(wav_file_path)
+            with self._open_audio(wav_file) as f:
+                try:
+                    # Encode with mono 128k (good quality for speech) and read the MP3 from ffmpeg's stdout
+                    result = subprocess.run(
+                        ['ffmpeg', '-y', '-i', wav_file if is_path else 'pipe:0',
+                         '-ac', '1', '-b:a', '128k', '-f', 'mp3', 'pipe:1'],
+                        input=None if is_path else f.read(),
+                        check=True,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.DEVNULL,
+                        timeout=FFMPEG_TIMEOUT
+                    )
+                    mp3_audio = io.BytesIO(result.stdout)
+                except FileNotFoundError:
+                    logger.warning("ffmpeg binary not found, converting with pydub")
+                    from pydub import AudioSegment
+                    f.seek(0)
+                    mp3_audio = io.BytesIO()
+                    AudioSegment.from_wav(f).export(mp3_audio, format="mp3", bitrate="128k", parameters=["-ac", "1"])
             
-            # Export as MP3 with good quality
-            audio.export(
-                mp3_file_path, 
-                format="mp3", 
-                bitrate="128k",  # Good quality for speech
-                parameters=["-ac", "1"]  # Mono channel
-            )
-            
-            # Verify MP3 file was created
-            if os.path.exists(mp3_file_path) and os.path.getsize(mp3_file_path) > 0:
-                logger.info(f"Successfully converted to MP3: {os.path.getsize(mp3_file_path)} bytes")
-                return mp3_file_path
-            else:
-                logger.error("MP3 conversion failed - no output file")
+            mp3_size = mp3_audio.getbuffer().nbytes
+            if not mp3_size:
+                logger.error("MP3 conversion failed - no output")
                 return None
+            
+            logger.info(f"Successfully converted to MP3: {mp3_size} bytes")
+            mp3_audio.seek(0)
+            return mp3_audio
                 
         except Exception as e:
             logger.error(f"WAV to MP3 conversion error: {e}")
             return None
 
-    def _cleanup_temp_file(self, file_path):
-        """Clean up temporary files"""
-        if file_path and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-                logger.info(f"Cleaned up temporary file: {file_path}")
-            except Exception as e:
-                logger.warning(f"Could not clean up temp file {file_path}: {e}")
-
-    def _upload_audio_simple(self, audio_file_path):
-        """Simplified upload method - exactly like your working test code"""
+    def _upload_audio_simple(self, audio_file):
+        """Stream the audio body to AssemblyAI /upload on the shared session; returns its upload_url or None"""
         try:
             logger.info("Uploading audio file to AssemblyAI...")
             
-            # Upload the audio file - EXACT same method as your working code
-            with open(audio_file_path, 'rb') as f:
-                response = requests.post(
-                    'https://api.assemblyai.com/v2/upload',
-                    headers=self.headers, 
-                    files={'file': f}
+            # Stream the raw bytes; /upload takes the body as-is, so no multipart encoding
+            file_size = self._audio_size(audio_file)
+            with self._open_audio(audio_file) as f:
+                response = self.session.post(
+                    f'{self.base_url}/upload',
+                    headers={'content-type': 'application/octet-stream'},
+                    data=f if isinstance(audio_file, str) else UploadBody(f, file_size),
+                    timeout=UPLOAD_TIMEOUT
                 )
             
             if response.status_code != 200:
@@ -130,21 +264,25 @@ class TranscriptionManager:
             return None
 
     def _request_transcription(self, audio_url):
-        """Request transcription - exactly like your working test code"""
+        """Create a transcript job for audio_url and return its id, or None on failure"""
         try:
-            # Request transcription with disfluencies enabled - EXACT same as your code
+            # Disfluencies stay in the transcript because the filler-word analysis depends on them
             data = {
                 'audio_url': audio_url,
                 'disfluencies': True,  # Preserves "uh", "um", etc.
                 'filter_profanity': False,
                 'punctuate': True
             }
+            if self.webhook_url:
+                data['webhook_url'] = self.webhook_url
+                data['webhook_auth_header_name'] = WEBHOOK_HEADER_NAME
+                data['webhook_auth_header_value'] = self.config.ASSEMBLY_AI_WEBHOOK_TOKEN
             
             logger.info("Starting transcription...")
-            response = requests.post(
-                'https://api.assemblyai.com/v2/transcript',
-                json=data, 
-                headers=self.headers
+            response = self.session.post(
+                f'{self.base_url}/transcript',
+                json=data,
+                timeout=REQUEST_TIMEOUT
             )
             
             if response.status_code != 200:
@@ -152,6 +290,8 @@ class TranscriptionManager:
                 return None
             
             transcript_id = response.json()['id']
+            if self.webhook_url:
+                self._completion_event(transcript_id)
             logger.info(f"Transcription started with ID: {transcript_id}")
             return transcript_id
             
@@ -159,16 +299,29 @@ class TranscriptionManager:
             logger.error(f"Transcription request error: {e}")
             return None
 
+    def _completion_event(self, transcript_id):
+        with self._completion_lock:
+            return self._completion_events.setdefault(transcript_id, threading.Event())
+
+    def notify_transcript_ready(self, transcript_id):
+        """Called from the AssemblyAI webhook; wakes the request waiting on this transcript"""
+        with self._completion_lock:
+            event = self._completion_events.get(transcript_id)
+        if event:
+            event.set()
+
     def _wait_for_completion(self, transcript_id):
-        """Wait for completion - exactly like your working test code"""
+        """Poll the transcript with backoff, waking early on the webhook; returns its text or None"""
         try:
             logger.info("Waiting for transcription completion")
             
-            # Wait for completion - EXACT same logic as your code
-            while True:
-                response = requests.get(
-                    f'https://api.assemblyai.com/v2/transcript/{transcript_id}',
-                    headers=self.headers
+            completed = self._completion_event(transcript_id)
+            start = time.monotonic()
+            attempts = 0
+            while time.monotonic() - start < TRANSCRIPTION_TIMEOUT:
+                response = self.session.get(
+                    f'{self.base_url}/transcript/{transcript_id}',
+                    timeout=REQUEST_TIMEOUT
                 )
                 
                 if response.status_code != 200:
@@ -187,28 +340,186 @@ class TranscriptionManager:
                     return None
                 
                 logger.info("Processing...")
-                time.sleep(3)
+                # Short clips finish quickly, so poll soon and back off for longer ones
+                delay = min(POLL_MAX_DELAY, POLL_INITIAL_DELAY * (POLL_BACKOFF ** attempts))
+                attempts += 1
+                # Returns early when the webhook reports completion
+                if completed.wait(delay):
+                    completed.clear()
+            
+            logger.error(f"Transcription timed out after {TRANSCRIPTION_TIMEOUT}s")
+            return None
             
         except Exception as e:
             logger.error(f"Transcription completion check error: {e}")
             return None
+        finally:
+            with self._completion_lock:
+                self._completion_events.pop(transcript_id, None)
 
-    def get_audio_duration(self, audio_file_path):
-        """Get audio duration using pydub for accuracy"""
+    def stream_transcribe(self, ws, sample_rate):
+        """Relay PCM frames from the browser socket to AssemblyAI realtime and echo transcripts back"""
+        import websocket
+        
+        upstream = websocket.create_connection(
+            f'{REALTIME_URL}?sample_rate={sample_rate}',
+            header=[f'Authorization: {self.api_token}'],
+            timeout=REQUEST_TIMEOUT
+        )
+        # Frames arrive continuously once connected, so only the handshake needs a timeout
+        upstream.settimeout(None)
+        final_parts = []
+        
+        def relay_transcripts():
+            try:
+                while True:
+                    message = upstream.recv()
+                    if not message:
+                        break
+                    result = json.loads(message)
+                    message_type = result.get('message_type')
+                    if message_type in ('PartialTranscript', 'FinalTranscript'):
+                        text = result.get('text', '')
+                        if message_type == 'FinalTranscript' and text:
+                            final_parts.append(text)
+                        ws.send(json.dumps({'message_type': message_type, 'text': text}))
+                    elif message_type == 'SessionTerminated':
+                        break
+                    elif 'error' in result:
+                        logger.error(f"Realtime transcription error: {result['error']}")
+                        break
+            except Exception as e:
+                logger.warning(f"Realtime transcript relay stopped: {e}")
+        
+        reader = threading.Thread(target=relay_transcripts, name='realtime-relay', daemon=True)
+        reader.start()
         try:
-            if audio_file_path.lower().endswith('.wav'):
-                audio = AudioSegment.from_wav(audio_file_path)
-            elif audio_file_path.lower().endswith('.mp3'):
-                audio = AudioSegment.from_mp3(audio_file_path)
-            else:
+            last_frame = time.monotonic()
+            while reader.is_alive():
+                frame = ws.receive(timeout=STREAM_RECEIVE_INTERVAL)
+                if frame is None:
+                    # An open but silent socket must not hold the session and both threads forever
+                    if time.monotonic() - last_frame > STREAM_IDLE_TIMEOUT:
+                        logger.info("Browser audio stream idle, closing realtime session")
+                        break
+                    continue
+                last_frame = time.monotonic()
+                if isinstance(frame, bytes):
+                    upstream.send_binary(frame)
+                elif frame == STREAM_STOP_MESSAGE:
+                    break
+        except Exception as e:
+            logger.info(f"Browser audio stream closed: {e}")
+        finally:
+            try:
+                upstream.send(json.dumps({'terminate_session': True}))
+                reader.join(STREAM_CLOSE_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"Could not terminate realtime session cleanly: {e}")
+            finally:
+                upstream.close()
+        
+        transcription = ' '.join(final_parts).strip()
+        return transcription or None
+
+    def get_audio_duration(self, audio_file):
+        """Get audio duration in minutes of a path or seekable file, without decoding the audio"""
+        try:
+            seconds = self.get_audio_seconds(audio_file)
+            if seconds is None:
                 # Fallback to file size estimation
-                file_size = os.path.getsize(audio_file_path)
+                file_size = self._audio_size(audio_file)
                 return max(file_size / (1024 * 1024), 0.1)
             
             # Return duration in minutes
-            duration_minutes = len(audio) / (1000 * 60)  # pydub returns milliseconds
-            return max(duration_minutes, 0.1)
+            return max(seconds / 60, 0.1)
             
         except Exception as e:
             logger.warning(f"Could not get audio duration: {e}")
-            return 1.0  # Default fallback
\ No newline at end of file
+            return 1.0  # Default fallback
+
+    def get_audio_seconds(self, audio_file):
+        """Exact duration in seconds from the container header, or None if it cannot be read"""
+        try:
+            is_path = isinstance(audio_file, str)
+            seconds = None
+            if self.sniff_audio_format(audio_file) == 'wav':
+                with self._open_audio(audio_file) as f:
+                    seconds = self._canonical_wav_seconds(f)
+                if seconds is None:
+                    try:
+                        with self._open_audio(audio_file) as f, wave.open(f, 'rb') as wav_file:
+                            frames = wav_file.getnframes()
+                            frame_size = wav_file.getsampwidth() * wav_file.getnchannels()
+                            # A placeholder data size reads as 0 frames or more than the file holds
+                            if not 0 < frames * frame_size <= self._audio_size(audio_file):
+                                return None
+                            seconds = frames / float(wav_file.getframerate())
+                    except (wave.Error, EOFError):
+                        pass  # Non-PCM or not a WAV; let mutagen read it
+            
+            if seconds is None:
+                with self._open_audio(audio_file) as f:
+                    audio = mutagen.File(f)
+                if audio is not None and audio.info:
+                    seconds = audio.info.length
+                elif is_path:
+                    seconds = self._ffprobe_seconds(audio_file)
+            
+            return seconds
+            
+        except Exception as e:
+            logger.warning(f"Could not read audio header: {e}")
+            return None
+
+    def sniff_audio_format(self, audio_file):
+        """Container format ('wav', 'mp3', 'ogg', 'webm', 'flac', 'm4a' or 'aac') from the first bytes, or None"""
+        with self._open_audio(audio_file) as f:
+            head = f.read(AUDIO_SNIFF_SIZE)
+        
+        if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+            return 'wav'
+        if head[4:8] == b'ftyp':
+            return 'm4a'
+        for audio_format, magic in AUDIO_SIGNATURES:
+            if head.startswith(magic):
+                return audio_format
+        if len(head) > 1 and head[0] == 0xFF:
+            # AAC ADTS: 12-bit sync and layer bits 00
+            if head[1] & 0xF6 == 0xF0:
+                return 'aac'
+            # Bare MPEG audio: 11-bit frame sync (0xFFFB for MPEG-1 Layer III),
+            # with neither the version nor the layer set to its reserved value
+            if head[1] & 0xE0 == 0xE0 and head[1] & 0x18 != 0x08 and head[1] & 0x06:
+                return 'mp3'
+        return None
+
+    def _canonical_wav_seconds(self, f):
+        """Duration from a canonical 44-byte header in one read, or None if the layout differs
+        or the data size is a streaming placeholder"""
+        header = f.read(WAV_HEADER.size)
+        if len(header) < WAV_HEADER.size:
+            return None
+        
+        (riff, _, wave_tag, fmt_tag, fmt_size, audio_format, channels, rate,
+         _, _, bits, data_tag, data_size) = WAV_HEADER.unpack_from(header)
+        
+        if (riff != b'RIFF' or wave_tag != b'WAVE' or fmt_tag != b'fmt ' or fmt_size != 16
+                or audio_format != 1 or data_tag != b'data' or not (rate and channels and bits)
+                or data_size in WAV_PLACEHOLDER_SIZES):
+            return None
+        return data_size / (rate * channels * bits // 8)
+
+    def _ffprobe_seconds(self, audio_file_path):
+        """Container duration reported by ffprobe, or None if it is unavailable"""
+        try:
+            result = subprocess.run(
+                ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', audio_file_path],
+                check=True,
+                capture_output=True,
+                text=True,
+                timeout=REQUEST_TIMEOUT
+            )
+            return float(result.stdout.strip())
+        except (OSError, subprocess.SubprocessError, ValueError):
+            return None
@@ -1,13 +1,20 @@
 from flask import render_template, request, jsonify, redirect, url_for, flash, current_app
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
-import os
+from flask_sock import Sock
+from concurrent.futures import Future, ThreadPoolExecutor
+import hmac
 import json
 import logging
+import shutil
+import tempfile
+import threading
 import time
+import uuid
+from urllib.parse import urlparse
 
-from managers.transcription_manager import TranscriptionManager
-from managers.ai_manager import AIManager
+from config import Config
+from managers.transcription_manager import get_transcription_manager, WEBHOOK_HEADER_NAME
+from managers.ai_manager import get_ai_manager
 from managers.game_manager import GameManager
 from services.auth_routes import create_auth_routes
 
@@ -17,11 +24,54 @@ logger = logging.getLogger(__name__)
 upload_cache = {}
 CACHE_TIMEOUT = 30  # seconds
 
+# Uploads are answered with 202 and processed here; clients poll /api/job/<job_id>
+speech_job_runner = ThreadPoolExecutor(max_workers=8, thread_name_prefix='speech-jobs')
+RECORDING_SPOOL_SIZE = 8 * 1024 * 1024  # bytes kept in memory before a job's copy spills to disk
+COPY_BUFFER_SIZE = 1024 * 1024  # bytes per read when copying an upload into its spool file
+# Recordings below either limit are rejected before they reach AssemblyAI
+MIN_RECORDING_BYTES = 2048
+MIN_SPEECH_SECONDS = 3
+
+PROFILE_HISTORY_PAGE_SIZE = 20
+
+# Independent reads for one page are fetched side by side on separate pooled connections;
+# sized to the pool, since a read without a connection would only wait for one
+PAGE_READ_WORKERS = Config.DB_POOL_MAX_CONNECTIONS
+page_reads = ThreadPoolExecutor(max_workers=PAGE_READ_WORKERS, thread_name_prefix='page-reads')
+page_read_slots = threading.BoundedSemaphore(PAGE_READ_WORKERS)
+
+def submit_page_read(fn, *args):
+    """Run fn on page_reads if a worker is idle, else inline on the request thread.
+    
+    Returns a Future either way, so under load a page degrades to serial reads
+    instead of queueing behind other requests' reads.
+    """
+    if not page_read_slots.acquire(blocking=False):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    
+    future = page_reads.submit(fn, *args)
+    future.add_done_callback(lambda _: page_read_slots.release())
+    return future
+
 def create_routes(app, db_manager, auth_manager):
-    # Initialize managers
-    transcription_manager = TranscriptionManager()
-    ai_manager = AIManager()
-    game_manager = GameManager(db_manager)
+    # Initialize managers once per app; the HTTP clients behind them are process-wide
+    if 'managers' not in app.extensions:
+        app.extensions['managers'] = {
+            'transcription': get_transcription_manager(),
+            'ai': get_ai_manager(),
+            'game': GameManager(db_manager),
+        }
+    managers = app.extensions['managers']
+    transcription_manager = managers['transcription']
+    ai_manager = managers['ai']
+    game_manager = managers['game']
+    
+    sock = Sock(app)
     
     # Register auth routes
     create_auth_routes(app, auth_manager)
@@ -36,14 +86,15 @@ def create_routes(app, db_manager, auth_manager):
     @login_required
     def dashboard():
         try:
-            levels = game_manager.get_all_levels(current_user.id)
-            user_stats = auth_manager.get_user_statistics(current_user.id)
-            recent_speeches = game_manager.get_user_speech_history(current_user.id, 5)
+            user_id = current_user.id
+            levels = submit_page_read(game_manager.get_all_levels, user_id)
+            user_stats = submit_page_read(auth_manager.get_user_statistics, user_id)
+            recent_speeches = submit_page_read(game_manager.get_user_speech_history, user_id, 5)
             
             return render_template('dashboard.html', 
-                                 levels=levels, 
-                                 user_stats=user_stats,
-                                 recent_speeches=recent_speeches)
+                                 levels=levels.result(), 
+                                 user_stats=user_stats.result(),
+                                 recent_speeches=recent_speeches.result())
         except Exception as e:
             logger.error(f"Dashboard error: {e}")
             flash('Error loading dashboard', 'error')
@@ -83,38 +134,92 @@ def create_routes(app, db_manager, auth_manager):
     @login_required
     def profile():
         try:
-            user_stats = auth_manager.get_user_statistics(current_user.id)
-            speech_history = game_manager.get_user_speech_history(current_user.id, 20)
-            levels_progress = game_manager.get_all_levels(current_user.id)
+            user_id = current_user.id
+            # ?before=<cursor> pages back through older speeches
+            before = request.args.get('before')
+            user_stats = submit_page_read(auth_manager.get_user_statistics, user_id)
+            speech_history = submit_page_read(game_manager.get_user_speech_history, user_id,
+                                               PROFILE_HISTORY_PAGE_SIZE, before)
+            levels_progress = submit_page_read(game_manager.get_all_levels, user_id)
             
+            speech_history = speech_history.result()
             return render_template('profile.html', 
-                                 user_stats=user_stats,
+                                 user_stats=user_stats.result(),
                                  speech_history=speech_history,
-                                 levels_progress=levels_progress)
+                                 levels_progress=levels_progress.result(),
+                                 is_older_page=bool(before),
+                                 next_cursor=game_manager.next_history_cursor(
+                                     speech_history, PROFILE_HISTORY_PAGE_SIZE))
         except Exception as e:
             logger.error(f"Profile error: {e}")
             flash('Error loading profile', 'error')
             return redirect(url_for('dashboard'))
     
-    @app.route('/api/upload-audio', methods=['POST'])
-    @login_required
-    def upload_audio():
+    def process_speech_job(job_id, cache_key, recording, content_type, user_id, level_number, task_id,
+                           is_quick_task, task_prompt):
+        """Background job: transcribe, analyze and score one uploaded recording"""
+        try:
+            # Get audio duration (this does NOT call transcription)
+            audio_duration = transcription_manager.get_audio_duration(recording)
+            
+            # Transcribe audio using simplified method
+            transcription, error = transcription_manager.transcribe_audio(recording, content_type)
+            if error:
+                logger.error(f"Transcription failed: {error}")
+                game_manager.finish_speech_job(job_id, error=f'Transcription failed: {error}')
+                return
+            
+            if not transcription or len(transcription.strip()) < 3:
+                game_manager.finish_speech_job(job_id, error='Could not transcribe audio or speech too short. Please speak clearly for at least 3-5 seconds.')
+                return
+            
+            logger.info(f"Transcription successful: {transcription[:100]}...")
+            
+            # Analyze speech with AI
+            ai_feedback = ai_manager.analyze_speech(transcription, task_prompt)
+            
+            # Save the response, statistics and any level completion in one transaction
+            # (finished before the job reports success because it gates unlocking the next level)
+            response_id, _ = game_manager.finalize_upload(
+                user_id, level_number, task_id, transcription, ai_feedback, audio_duration, is_quick_task
+            )
+            if response_id is None:
+                game_manager.finish_speech_job(job_id, error='Could not save your speech. Please try again.')
+                return
+            
+            game_manager.finish_speech_job(job_id, result={
+                'success': True,
+                'response_id': response_id,
+                'transcription': transcription,
+                'analysis': ai_feedback
+            })
+            
+        except Exception as e:
+            logger.error(f"Speech job {job_id} error: {e}")
+            game_manager.finish_speech_job(job_id, error='Processing failed. Please try again.')
+        finally:
+            recording.close()
+            # Always remove from cache when done (success or failure)
+            upload_cache.pop(cache_key, None)
+    
+    def queue_speech_upload(source, fields, content_type):
+        """Copy an uploaded recording for a background job and answer 202 with its job id.
+        
+        fields holds level_number, task_id, is_quick_task and task_prompt
+        (request.form for multipart uploads, request.args for raw-body uploads);
+        content_type is the declared type, used only when the magic bytes are not recognised.
+        """
+        recording = None
         try:
             # Create unique request identifier based on user, timestamp, and file size
             user_id = current_user.id
             current_time = int(time.time())
             
-            if 'audio' not in request.files:
-                return jsonify({'error': 'No audio file provided'}), 400
-            
-            audio_file = request.files['audio']
-            if audio_file.filename == '':
-                return jsonify({'error': 'No file selected'}), 400
-            
-            # Get file size for duplicate detection
-            audio_file.seek(0, 2)  # Seek to end
-            file_size = audio_file.tell()
-            audio_file.seek(0)  # Reset to beginning
+            # The request's stream is closed when the response is sent, so the job gets its own copy
+            recording = tempfile.SpooledTemporaryFile(max_size=RECORDING_SPOOL_SIZE)
+            shutil.copyfileobj(source, recording, COPY_BUFFER_SIZE)
+            file_size = recording.tell()
+            recording.seek(0)
             
             # Create cache key to prevent duplicate uploads
             cache_key = f"{user_id}_{file_size}_{current_time // 5}"  # 5-second window
@@ -122,96 +227,119 @@ def create_routes(app, db_manager, auth_manager):
             # Check if this upload is already in progress
             if cache_key in upload_cache:
                 logger.warning(f"Duplicate upload attempt detected for user {user_id}")
+                recording.close()
                 return jsonify({'error': 'Upload already in progress'}), 429
             
-            # Mark this upload as in progress
+            # Clean up old cache entries
+            cleanup_cache()
+            
+            logger.info(f"Audio upload received from user {user_id}, size: {file_size} bytes")
+            
+            # Check minimum file size 
+            if file_size < MIN_RECORDING_BYTES:  # Header-only or empty recording
+                logger.error(f"Audio file too small: {file_size} bytes")
+                recording.close()
+                return jsonify({'error': 'Audio file is too small. Please record a longer message.'}), 400
+            
+            # Browsers mislabel recordings, so trust the container's magic bytes over the declared type
+            # and only fall back to it for containers the sniffer does not know
+            if not transcription_manager.sniff_audio_format(recording):
+                if not content_type or not content_type.startswith('audio/'):
+                    logger.error(f"Unrecognised audio format from user {user_id}")
+                    recording.close()
+                    return jsonify({'error': 'Unsupported audio format. Please upload an audio recording such as WAV, MP3, M4A, FLAC, Ogg or WebM.'}), 400
+                logger.warning(f"Unrecognised audio bytes from user {user_id}, trusting declared type {content_type}")
+            
+            # Reading the duration from the header is cheap, so clips too short to score never get uploaded;
+            # an unknown duration (None) is let through
+            audio_seconds = transcription_manager.get_audio_seconds(recording)
+            if audio_seconds is not None and audio_seconds < MIN_SPEECH_SECONDS:
+                logger.info(f"Recording too short: {audio_seconds:.1f}s")
+                recording.close()
+                return jsonify({'error': f'Speech too short. Please speak clearly for at least {MIN_SPEECH_SECONDS} seconds.'}), 400
+            
+            # Mark this upload as in progress; the job clears it when it finishes
             upload_cache[cache_key] = current_time
             
-            try:
-                level_number = request.form.get('level_number', type=int)
-                task_id = request.form.get('task_id', type=int)
-                is_quick_task = request.form.get('is_quick_task', 'false').lower() == 'true'
-                task_prompt = request.form.get('task_prompt', '')
-                
-                # Clean up old cache entries
-                cleanup_cache()
-                
-                # Generate timestamp-based filename
-                timestamp = int(time.time())
-                filename = f"user_{user_id}_{timestamp}.wav"
-                filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                
-                # Save the audio file
-                audio_file.save(filepath)
-                
-                # Verify file was saved and has content
-                if not os.path.exists(filepath):
-                    return jsonify({'error': 'Failed to save audio file'}), 500
-                
-                actual_file_size = os.path.getsize(filepath)
-                logger.info(f"Audio file saved: {filepath}, size: {actual_file_size} bytes")
-                
-                # Check minimum file size 
-                if actual_file_size < 1000:  # Less than 1KB is likely empty
-                    logger.error(f"Audio file too small: {actual_file_size} bytes")
-                    cleanup_file(filepath)
-                    return jsonify({'error': 'Audio file is too small. Please record a longer message.'}), 400
-                
-                # Get audio duration (this does NOT call transcription)
-                audio_duration = transcription_manager.get_audio_duration(filepath)
-                
-                # Transcribe audio using simplified method
-                transcription, error = transcription_manager.transcribe_audio(filepath, 'audio/wav')
-                if error:
-                    logger.error(f"Transcription failed: {error}")
-                    cleanup_file(filepath)
-                    return jsonify({'error': f'Transcription failed: {error}'}), 500
-                
-                if not transcription or len(transcription.strip()) < 3:
-                    cleanup_file(filepath)
-                    return jsonify({'error': 'Could not transcribe audio or speech too short. Please speak clearly for at least 3-5 seconds.'}), 400
-                
-                logger.info(f"Transcription successful: {transcription[:100]}...")
-                
-                # Analyze speech with AI
-                ai_feedback = ai_manager.analyze_speech(transcription, task_prompt)
-                
-                # Save response to database
-                response_id = game_manager.save_speech_response(
-                    user_id, level_number, task_id, 
-                    transcription, ai_feedback, audio_duration, is_quick_task
-                )
-                
-                # Update user statistics
-                auth_manager.update_user_statistics(user_id, ai_feedback)
-                
-                # Calculate and save level completion if not quick task
-                if not is_quick_task and level_number:
-                    score = game_manager.calculate_level_score(ai_feedback)
-                    if score >= 60:  # Passing score
-                        game_manager.complete_level(user_id, level_number, score)
-                
-                # Clean up audio file ONLY after successful processing
-                cleanup_file(filepath)
-                
-                return jsonify({
-                    'success': True,
-                    'transcription': transcription,
-                    'analysis': ai_feedback,
-                    'response_id': response_id
-                })
-                
-            finally:
-                # Always remove from cache when done (success or failure)
-                upload_cache.pop(cache_key, None)
+            job_id = uuid.uuid4().hex
+            game_manager.create_speech_job(job_id, user_id)
+            speech_job_runner.submit(
+                process_speech_job, job_id, cache_key, recording, content_type, user_id,
+                fields.get('level_number', type=int),
+                fields.get('task_id', type=int),
+                fields.get('is_quick_task', 'false').lower() == 'true',
+                fields.get('task_prompt', '')
+            )
+            
+            return jsonify({'job_id': job_id, 'status': 'pending'}), 202
                 
         except Exception as e:
             logger.error(f"Upload audio error: {e}")
             # Clean up cache entry on error
             if 'cache_key' in locals():
                 upload_cache.pop(cache_key, None)
+            if recording is not None:
+                recording.close()
             return jsonify({'error': 'Processing failed. Please try again.'}), 500
     
+    @app.route('/api/upload-audio', methods=['POST'])
+    @login_required
+    def upload_audio():
+        if 'audio' not in request.files:
+            return jsonify({'error': 'No audio file provided'}), 400
+        
+        audio_file = request.files['audio']
+        if audio_file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+        
+        return queue_speech_upload(audio_file.stream, request.form, audio_file.mimetype)
+    
+    @app.route('/api/upload-audio-raw', methods=['POST'])
+    @login_required
+    def upload_audio_raw():
+        # The body is the recording itself, so there is no multipart parsing or spooling;
+        # the task fields travel in the query string
+        return queue_speech_upload(request.stream, request.args, request.mimetype)
+    
+    @app.route('/api/job/<job_id>')
+    @login_required
+    def speech_job_status(job_id):
+        job = game_manager.get_speech_job(job_id, current_user.id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        response = {'job_id': job_id, 'status': job['status']}
+        if job['status'] == 'completed':
+            response.update(job['result'])
+        elif job['status'] == 'failed':
+            response['error'] = job['error']
+        return jsonify(response)
+    
+    @sock.route('/ws/transcribe')
+    def transcribe_stream(ws):
+        if not current_app.config['LIVE_CAPTIONS_ENABLED']:
+            ws.close(1008, 'Live captions are disabled')
+            return
+        
+        if not current_user.is_authenticated:
+            ws.close(1008, 'Login required')
+            return
+        
+        # Browsers send cookies on cross-site WebSocket handshakes, so only our own pages may connect
+        origin = request.headers.get('Origin')
+        if not origin or urlparse(origin).netloc != request.host:
+            logger.warning(f"Rejected realtime stream from origin {origin!r}")
+            ws.close(1008, 'Origin not allowed')
+            return
+        
+        sample_rate = request.args.get('sample_rate', 16000, type=int)
+        try:
+            # Live captions only: the realtime model drops disfluencies, so scoring keeps
+            # the batch transcript of the uploaded recording
+            transcription_manager.stream_transcribe(ws, sample_rate)
+        except Exception as e:
+            logger.error(f"Realtime transcription stream error: {e}")
+    
     @app.route('/api/generate-quick-task')
     @login_required
     def generate_quick_task_api():
@@ -232,6 +360,22 @@ def create_routes(app, db_manager, auth_manager):
             logger.error(f"Leaderboard API error: {e}")
             return jsonify({'error': 'Failed to load leaderboard'}), 500
     
+    @app.route('/hooks/assemblyai', methods=['POST'])
+    def assemblyai_webhook():
+        expected_token = current_app.config['ASSEMBLY_AI_WEBHOOK_TOKEN']
+        received_token = request.headers.get(WEBHOOK_HEADER_NAME, '')
+        if not expected_token or not hmac.compare_digest(received_token, expected_token):
+            return jsonify({'error': 'Unauthorized'}), 401
+        
+        payload = request.get_json(silent=True) or {}
+        transcript_id = payload.get('transcript_id')
+        if not transcript_id:
+            return jsonify({'error': 'Missing transcript_id'}), 400
+        
+        logger.info(f"AssemblyAI webhook: transcript {transcript_id} is {payload.get('status')}")
+        transcription_manager.notify_transcript_ready(transcript_id)
+        return '', 204
+    
     @app.route('/favicon.ico')
     def favicon():
         return '', 204  # No content response for favicon
@@ -261,15 +405,6 @@ def create_routes(app, db_manager, auth_manager):
             <a href="/">Go Home</a>
             ''', 500
 
-def cleanup_file(filepath):
-    """Clean up uploaded file"""
-    try:
-        if os.path.exists(filepath):
-            os.remove(filepath)
-            logger.info(f"Cleaned up audio file: {filepath}")
-    except Exception as cleanup_error:
-        logger.warning(f"Could not clean up file: {cleanup_error}")
-
 def cleanup_cache():
     """Remove old entries from upload cache"""
     current_time = int(time.time())
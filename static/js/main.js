@@ -16,6 +16,11 @@ class AudioRecorder {
         this.recordedBuffers = [];
         this.processor = null;
         
+        // Realtime transcription socket; only drives the live caption, scoring uses the upload
+        this.liveCaptions = document.body.dataset.liveCaptions === 'true';
+        this.streamSocket = null;
+        this.pendingFrames = [];
+        
         this.initializeElements();
     }
 
@@ -88,6 +93,10 @@ class AudioRecorder {
             const source = this.audioContext.createMediaStreamSource(this.stream);
             source.connect(this.analyser);
             
+            if (this.liveCaptions) {
+                this.openTranscriptionStream(this.audioContext.sampleRate);
+            }
+            
             this.analyser.fftSize = 256;
             this.analyser.smoothingTimeConstant = 0.8;
 
@@ -106,6 +115,7 @@ class AudioRecorder {
                     const bufferCopy = new Float32Array(inputData.length);
                     bufferCopy.set(inputData);
                     this.recordedBuffers.push(bufferCopy);
+                    this.queueStreamFrame(bufferCopy);
                 }
             };
 
@@ -156,10 +166,75 @@ class AudioRecorder {
         
         // Process the recorded buffers into WAV
         setTimeout(() => {
+            this.closeTranscriptionStream();
             this.processWAVRecording();
         }, 100); // Small delay to ensure all processing is done
     }
 
+    openTranscriptionStream(sampleRate) {
+        this.pendingFrames = [];
+
+        try {
+            const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+            const socket = new WebSocket(`${protocol}://${window.location.host}/ws/transcribe?sample_rate=${Math.round(sampleRate)}`);
+            socket.binaryType = 'arraybuffer';
+
+            socket.onmessage = (event) => {
+                const message = JSON.parse(event.data);
+                if (message.text && this.isRecording && this.recordingStatus) {
+                    // Live caption while recording
+                    this.recordingStatus.textContent = message.text;
+                }
+            };
+            socket.onerror = () => console.log('Realtime transcription unavailable, no live caption');
+
+            this.streamSocket = socket;
+        } catch (error) {
+            console.log('Could not open realtime transcription stream:', error);
+            this.streamSocket = null;
+        }
+    }
+
+    queueStreamFrame(samples) {
+        const socket = this.streamSocket;
+        if (!socket || socket.readyState > WebSocket.OPEN) return;
+
+        // Frames captured while the socket is still connecting are sent once it opens
+        this.pendingFrames.push(samples);
+        // AssemblyAI wants chunks of at least 100ms; one 4096-sample block is ~93ms at 44.1kHz
+        if (socket.readyState === WebSocket.OPEN && this.pendingFrames.length >= 2) {
+            this.flushStreamFrames(socket);
+        }
+    }
+
+    flushStreamFrames(socket) {
+        const length = this.pendingFrames.reduce((sum, frame) => sum + frame.length, 0);
+        if (length === 0) return;
+
+        const pcm = new Int16Array(length);
+        let offset = 0;
+        for (const frame of this.pendingFrames) {
+            for (let i = 0; i < frame.length; i++) {
+                const sample = Math.max(-1, Math.min(1, frame[i]));
+                pcm[offset++] = sample * 0x7FFF;
+            }
+        }
+        this.pendingFrames = [];
+        socket.send(pcm.buffer);
+    }
+
+    closeTranscriptionStream() {
+        const socket = this.streamSocket;
+        this.streamSocket = null;
+        if (!socket) return;
+
+        if (socket.readyState === WebSocket.OPEN) {
+            this.flushStreamFrames(socket);
+            socket.send('stop');
+        }
+        socket.close();
+    }
+
     processWAVRecording() {
         console.log('Processing WAV recording...');
         console.log('Recorded buffers:', this.recordedBuffers.length);
@@ -275,11 +350,8 @@ class AudioRecorder {
                 this.loadingOverlay.classList.add('show');
             }
 
-            const formData = new FormData();
-            
-            // Use proper WAV filename with timestamp
-            const fileName = `recording_${Date.now()}.wav`;
-            formData.append('audio', audioBlob, fileName);
+            // The WAV blob is the request body; task info goes in the query string
+            const params = new URLSearchParams();
             
             console.log('Uploading WAV audio blob of size:', audioBlob.size);
 
@@ -289,18 +361,19 @@ class AudioRecorder {
             const isQuickTask = window.isQuickTask || false;
             const taskPrompt = window.currentTaskPrompt || '';
             
-            if (levelNumber) formData.append('level_number', levelNumber);
-            if (taskId) formData.append('task_id', taskId);
-            formData.append('is_quick_task', isQuickTask);
-            if (taskPrompt) formData.append('task_prompt', taskPrompt);
+            if (levelNumber) params.append('level_number', levelNumber);
+            if (taskId) params.append('task_id', taskId);
+            params.append('is_quick_task', isQuickTask);
+            if (taskPrompt) params.append('task_prompt', taskPrompt);
 
             // SINGLE REQUEST - with timeout to prevent hanging
             const controller = new AbortController();
             const timeoutId = setTimeout(() => controller.abort(), 30000); // 30 second timeout
 
-            const response = await fetch('/api/upload-audio', {
+            const response = await fetch(`/api/upload-audio-raw?${params}`, {
                 method: 'POST',
-                body: formData,
+                headers: { 'Content-Type': 'audio/wav' },
+                body: audioBlob,
                 signal: controller.signal
             });
 
@@ -311,8 +384,12 @@ class AudioRecorder {
                 throw new Error(errorData.error || 'Upload failed');
             }
 
-            const result = await response.json();
-            console.log('Upload successful:', result);
+            // The server answers 202 with a job id and processes the recording in the background
+            const job = await response.json();
+            console.log('Upload accepted, job:', job.job_id);
+
+            const result = await this.waitForJob(job.job_id);
+            console.log('Processing complete:', result);
             
             this.displayResults(result.transcription, result.analysis);
 
@@ -334,6 +411,28 @@ class AudioRecorder {
         }
     }
 
+    async waitForJob(jobId) {
+        // Transcription can take a while for long speeches, so poll with a gentle backoff
+        const deadline = Date.now() + 180000; // 3 minute limit, matching the server's transcription timeout
+        let delay = 500;
+
+        while (Date.now() < deadline) {
+            await new Promise(resolve => setTimeout(resolve, delay));
+            delay = Math.min(delay * 1.5, 3000);
+
+            const response = await fetch(`/api/job/${jobId}`);
+            const job = await response.json();
+            if (!response.ok || job.status === 'failed') {
+                throw new Error(job.error || 'Processing failed');
+            }
+            if (job.status === 'completed') {
+                return job;
+            }
+        }
+
+        throw new Error('Processing timed out. Please try again.');
+    }
+
     resetRecorder() {
         this.isRecording = false;
         this.isProcessing = false;